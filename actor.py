@@ -1,7 +1,10 @@
-import pygame
-from typing import Tuple, Optional
+from typing import List, Tuple, Optional, Sequence
 from settings import *
 
+# A sprite is named by the path of its PNG and whether it is mirrored
+# horizontally; the renderer turns it into an image.
+Sprite = Tuple[str, bool]
+
 class Actor:
     """
     A class that represents all the actors in the game. This class includes any
@@ -12,41 +15,49 @@ class Actor:
         x coordinate of this actor's location on the stage
     y:
         y coordinate of this actor's location on the stage
-    image:
-        the image of the actor
+    kind:
+        the kind of the actor, as an index in KINDS
+    sprite:
+        the sprite of the actor, or None if it has none
 
     === Private Attributes ===
-    _is_stop:
-        Flag to keep track of whether this object cannot be moved through
-    _is_push:
-        Flag to keep track of whether this object is pushable
+    _flags:
+        The flags of every kind of actor, as combinations of the BIT_ values
+        indexed by kind. Flags belong to a kind rather than to one actor:
+        the actors of a game share the table of their Engine, so a rule
+        changes every actor of its kind at once. Only the engine changes the
+        table (see Engine._set_flags); an actor on its own has DEFAULT_FLAGS.
 
     Representation Invariant: x,y must be greater or equal to 0
     """
     x: int
     y: int
-    _is_stop: bool
-    _is_push: bool
-    image: pygame.Surface
+    kind: int
+    sprite: Optional[Sprite]
+    _flags: Sequence[int] = DEFAULT_FLAGS
 
     def __init__(self, x: int, y: int) -> None:
 
         self.x, self.y = x, y
-        self._is_stop = False
-        self._is_push = False
-        self.image = pygame.Surface((TILESIZE, TILESIZE))
+        self.sprite = None
 
     def is_stop(self) -> bool:
         """
-        Getter for _is_stop
+        Return whether this object cannot be moved through
         """
-        return self._is_stop
+        return self._flags[self.kind] & BIT_STOP != 0
 
     def is_push(self) -> bool:
         """
-        Getter for _is_push
+        Return whether this object is pushable
+        """
+        return self._flags[self.kind] & BIT_PUSH != 0
+
+    def flag_bits(self) -> int:
+        """
+        Return the flags of this actor as a combination of the BIT_ values
         """
-        return self._is_push
+        return self._flags[self.kind]
 
     def copy(self) -> 'Actor':
         """
@@ -55,97 +66,58 @@ class Actor:
         """
         raise NotImplementedError
 
-    def move(self, game_: 'Game', dx: int, dy: int) -> bool:
+    def move(self, game_: 'Engine', dx: int, dy: int) -> bool:
         """
         Function to move an Actor on the screen, to the direction
-        indicated by dx and dy
+        indicated by dx and dy, pushing whatever is in the way
 
-        game_: the Game object
+        game_: the Engine object
         dx: the offset in the x coordinate
-        dx: the offset in the y coordinate
+        dy: the offset in the y coordinate
 
         Returns whether <self> actually moves.
         """
-        rside = game_.get_actor(self.x+1, self.y)
-        lside = game_.get_actor(self.x-1, self.y)
-        up = game_.get_actor(self.x, self.y-1)
-        down = game_.get_actor(self.x, self.y+1)
-        if rside:
-            if rside.is_push():
-                if dx > 0:
-                    # rside = game_.get_actor(self.x+1, self.y)
-                    rside.move(game_, dx, dy)
-
-                    rside_bush = game_.get_actor(self.x +dx, self.y)
-                    if rside_bush and rside_bush.is_stop:
-                        return False
-
-            elif rside.is_stop():
-                if dx > 0:
-                    return False
-
-        if lside:
-            if lside.is_push():
-                if dx < 0:
-                    # lside = game_.get_actor(self.x -1, self.y)
-                    lside.move(game_, dx, dy)
-
-                    lside_bush = game_.get_actor(self.x +dx, self.y)
-                    if lside_bush and lside_bush.is_stop:
-                        return False
-            elif lside.is_stop():
-                if dx < 0:
-                    return False
-        if up:
-            if up.is_push():
-                if dy < 0:
-                    # up = game_.get_actor(self.x, self.y-1)
-                    up.move(game_, dx, dy)
-
-                    up_bush = game_.get_actor(self.x, self.y + dy)
-                    if up_bush and up_bush.is_stop:
-                        return False
-            elif up.is_stop():
-                if dy < 0:
-                    return False
-        # if down:
-        #     if down.is_push() and not down.is_stop():
-        #         if dy > 0:
-        #             # down = game_.get_actor(self.x, self.y+1)
-        #             down.move(game_, dx, dy)
-        #
-        #             down_bush = game_.get_actor(self.x, self.y + dy)
-        #             if down_bush and down_bush.is_stop:
-        #                 return False
-        #     else:
-        #         if dy > 0:
-        #             return False
-        if down:
-            if down.is_push():
-                if dy > 0:
-                    # down = game_.get_actor(self.x, self.y+1)
-                    down.move(game_, dx, dy)
-
-                    down_bush = game_.get_actor(self.x, self.y + dy)
-                    if down_bush and down_bush.is_stop:
-                        return False
-            elif down.is_stop():
-                if dy > 0:
-                    return False
-
-        self.y += dy
-        self.x += dx
-        x1 = game_.x_tiles
-        y1 = game_.y_tiles
-        if self.x <= 0:
-            self.x = 0
-        elif self.x >= x1:
-            self.x = x1
-        if self.y <= 0:
-            self.y = 0
-        elif self.y >= y1:
-            self.y = y1
-        return True
+        moved = self.push(game_, dx, dy)
+        return bool(moved) and moved[-1] is self
+
+    def push(self, game_: 'Engine', dx: int, dy: int) -> List['Actor']:
+        """
+        Move <self> one tile in the direction dx, dy, pushing the row of
+        pushable actors in front of it. Return the actors that moved, in the
+        order they moved: the farthest first, <self> last.
+
+        The row is walked once, up to the first cell that is empty or whose
+        bottom actor is neither push nor stop. Nothing moves if the row ends
+        at a stop actor or at the edge of the map instead. Otherwise the
+        actors are moved from the far end back; an actor stays put, along
+        with every actor behind it, if the cell in front of it is still
+        occupied, which happens when a pushed actor leaves others behind in
+        its cell.
+        """
+        # the row cannot be longer than the number of actors on the stage
+        row = [self]
+        x, y = self.x + dx, self.y + dy
+        while True:
+            if not (0 <= x < game_.x_tiles and 0 <= y < game_.y_tiles):
+                return []
+            ahead = game_.get_actor(x, y)
+            if ahead is None:
+                break
+            if not ahead.is_push():
+                if ahead.is_stop():
+                    return []
+                break
+            row.append(ahead)
+            x, y = x + dx, y + dy
+
+        moved = []
+        for actor_ in reversed(row):
+            if moved and game_.get_actor(actor_.x + dx,
+                                         actor_.y + dy) is not None:
+                break
+            game_.move_actor(actor_, actor_.x + dx, actor_.y + dy)
+            moved.append(actor_)
+        return moved
 
 
 class Character(Actor):
@@ -156,124 +128,38 @@ class Character(Actor):
     A Character could potentially be the player that is controlled by the
     key presses
 
-    === Additional Private Attributes ===
-    _is_player:
-        Whether the character is the player, i.e., "<Character> isYou"
-    _is_lose:
-        Whether the rules contains "<Character> isLose"
-    _is_win:
-        Whether the rules contains "<Character> isWin"
+    Besides stop and push, Characters have the flags BIT_PLAYER, for
+    "<Character> isYou", BIT_LOSE, for "<Character> isLose", and BIT_WIN, for
+    "<Character> isVictory". Like every flag, they are shared by all the
+    Characters of a kind.
     """
-    _is_player: bool
-    _is_lose: bool
-    _is_win: bool
-
-    def __init__(self, x: int, y: int) -> None:
-        """
-        Initializes the Character
-        """
-        super().__init__(x, y)
-        self._is_player = False
-        self._is_lose = False
-        self._is_win = False
 
     def is_win(self) -> bool:
         """
-        Getter for _is_win
+        Return whether reaching this character wins the game
         """
-        return self._is_win
+        return self._flags[self.kind] & BIT_WIN != 0
 
     def is_lose(self) -> bool:
         """
-        Getter for _is_lose
+        Return whether reaching this character loses the game
         """
-        return self._is_lose
+        return self._flags[self.kind] & BIT_LOSE != 0
 
     def is_player(self) -> bool:
         """
-        Getter for _is_player
-        """
-        return self._is_player
-
-    def set_player(self) -> None:
-        """
-        Sets flag to make this actor the player.
-        """
-        self._is_player = True
-        self._is_stop = False
-        self._is_push = False
-
-    def unset_player(self) -> None:
-        """
-        Unsets the flag to make the actor not the player.
-        """
-        self._is_player = False
-
-    def set_stop(self) -> None:
-        """
-        Sets flag to make actor incapable of being moved through or pushed.
-        """
-        self._is_stop = True
-        # self._is_push = False
-        # self._is_player = False
-
-    def unset_stop(self) -> None:
-        """
-        Unsets the flag that prevents actor from being moved through or pushed.
+        Return whether this character is "You", i.e. moved by the keys
         """
-        self._is_stop = False
-
-    def set_push(self) -> None:
-        """
-        Sets the flag that allows the actor to be pushable
-        """
-        self._is_push = True
-        # self._is_stop = False
-        # self._is_player = False
-
-    def unset_push(self) -> None:
-        """
-        Unsets the flag that allows the actor to be pushable
-        """
-        self._is_push = False
-
-    def set_win(self) -> None:
-        """
-        Sets this actor to be the win Condition.
-        """
-        self._is_win = True
-        self._is_lose = False
-
-    def unset_win(self) -> None:
-        """
-        Unsets this actor from being the win Condition.
-        """
-        self._is_win = False
-
-    def set_lose(self) -> None:
-        """
-        Sets this flag to be the lose condition.
-        """
-        self._is_lose = True
-        self._is_win = False
-
-    def unset_lose(self) -> None:
-        """
-        Unsets this flag from being the lose condition.
-        """
-        self._is_lose = False
+        return self._flags[self.kind] & BIT_PLAYER != 0
 
     def copy_flags(self, other: "Character") -> None:
         """
-        Copy the boolean flags to the <other> object
+        Give the <other> object the table of flags of this character, so that
+        it has the same flags.
         This is a helper method that should be used by the copy methods
         implemented in the subclasses.
         """
-        other._is_player = self._is_player
-        other._is_push = self._is_push
-        other._is_stop = self._is_stop
-        other._is_lose = self._is_lose
-        other._is_win = self._is_win
+        other._flags = self._flags
 
     def copy(self) -> 'Character':
         """
@@ -282,32 +168,21 @@ class Character(Actor):
         """
         raise NotImplementedError
 
-    def handle_key_press(self, game_: 'Game') -> Tuple[int, int]:
+    def turn(self, dx: int, dy: int) -> None:
         """
-        Process the key press input and
-        return (dx, dy), the offsets on the x and y directions.
+        Update the sprite for a move in the direction dx, dy.
+        Characters look the same in every direction by default.
         """
-        key_pressed = game_.keys_pressed
-        dx, dy = 0, 0
-        if key_pressed[pygame.K_LEFT]:
-            dx -= 1
-        elif key_pressed[pygame.K_RIGHT]:
-            dx += 1
-        elif key_pressed[pygame.K_UP]:
-            dy -= 1
-        elif key_pressed[pygame.K_DOWN]:
-            dy += 1
-        return dx, dy
+        pass
 
-    def player_move(self, game_: 'Game') -> bool:
+    def player_move(self, game_: 'Engine', dx: int, dy: int) -> bool:
         """
-        Detects input from the keyboard and moves the Player on the game stage
-        based on directional key presses.
+        Moves the Player on the game stage in the direction indicated by dx
+        and dy, turning it to face that direction.
 
-        Also, after the move, check if we have won or lost the game,
-        and call the win() and lose() methods in Game accordingly
+        Returns whether the Player actually moves.
         """
-        dx, dy = self.handle_key_press(game_)
+        self.turn(dx, dy)
         if dx == 0 and dy == 0:
             return False
         return self.move(game_, dx, dy)
@@ -323,38 +198,27 @@ class Meepo(Character):
 
     === Additional Public Attributes ===
     walk_right:
-        Image for walking right
+        Sprites for walking right
     walk_left:
-        Image for walking left
+        Sprites for walking left
     walk_up:
-        Image for walking up
+        Sprites for walking up
     walk_down:
-        Image for walking down
+        Sprites for walking down
     """
-    walk_left: list
-    walk_right: list
-    walk_down: list
-    walk_up: list
+    kind = KIND_IDS["Meepo"]
+    # Motion sprites, shared by every Meepo
+    walk_right = ((PLAYER_SPRITE_R1, False), (PLAYER_SPRITE_R2, False))
+    walk_left = ((PLAYER_SPRITE_R1, True), (PLAYER_SPRITE_R2, True))
+    walk_up = ((PLAYER_SPRITE_U1, False), (PLAYER_SPRITE_U2, False))
+    walk_down = ((PLAYER_SPRITE_B1, False), (PLAYER_SPRITE_B2, False))
 
     def __init__(self, x: int, y: int) -> None:
         """
         Initializes the Meepo Class
-        Load the images for displaying Ms. Meepo's movement.
         """
         super().__init__(x, y)
-
-        # Add motion images
-        self.walk_right = [load_image(PLAYER_SPRITE_R1),
-                           load_image(PLAYER_SPRITE_R2)]
-        self.walk_left = [
-            pygame.transform.flip(load_image(PLAYER_SPRITE_R1), True, False),
-            pygame.transform.flip(load_image(PLAYER_SPRITE_R2), True, False)
-        ]
-        self.walk_up = [load_image(PLAYER_SPRITE_U1),
-                        load_image(PLAYER_SPRITE_U2)]
-        self.walk_down = [load_image(PLAYER_SPRITE_B1),
-                          load_image(PLAYER_SPRITE_B2)]
-        self.image = self.walk_down[1]
+        self.sprite = self.walk_down[1]
 
     def copy(self):
         '''
@@ -365,59 +229,30 @@ class Meepo(Character):
         return mcopy
 
 
-    def handle_key_press(self, game_: 'Game') -> Tuple[int, int]:
-        """
-        Overriding the same method in the base class, adding the modification
-        of the image depending on the direction of the move.
-        """
-        key_pressed = game_.keys_pressed
-        dx, dy = 0, 0
-        if key_pressed[pygame.K_LEFT]:
-            if self.image == self.walk_left[0]:
-                self.image = self.walk_left[1]
-            elif self.image != self.walk_left[1]:
-                self.image = self.walk_left[0]
-            elif self.image == self.walk_left[1]:
-                self.image = self.walk_left[0]
-            dx -= 1
-
-        elif key_pressed[pygame.K_RIGHT]:
-            if self.image == self.walk_right[1]:
-                self.image = self.walk_right[0]
-            elif self.image != self.walk_right[0]:
-                self.image = self.walk_right[1]
-            elif self.image == self.walk_right[0]:
-                self.image = self.walk_right[1]
-            dx += 1
-        elif key_pressed[pygame.K_UP]:
-            if self.image == self.walk_up[0]:
-                self.image = self.walk_up[1]
-            elif self.image != self.walk_up[1]:
-                self.image = self.walk_up[0]
-            elif self.image == self.walk_up[1]:
-                self.image = self.walk_up[0]
-            dy -= 1
-        elif key_pressed[pygame.K_DOWN]:
-            if self.image == self.walk_down[1]:
-                self.image = self.walk_down[0]
-            elif self.image != self.walk_down[0]:
-                self.image = self.walk_down[1]
-            elif self.image == self.walk_down[0]:
-                self.image = self.walk_down[1]
-            dy += 1
-        return (dx,dy)
+    def turn(self, dx: int, dy: int) -> None:
+        """
+        Overriding the same method in the base class, alternating between the
+        two sprites of the direction of the move.
+        """
+        if dx < 0:
+            first, second = self.walk_left
+        elif dx > 0:
+            second, first = self.walk_right
+        elif dy < 0:
+            first, second = self.walk_up
+        elif dy > 0:
+            second, first = self.walk_down
+        else:
+            return
+        self.sprite = second if self.sprite == first else first
 
 class Wall(Character):
+    kind = KIND_IDS["Wall"]
 
     def __init__(self, x: int, y: int) -> None:
 
         super().__init__(x, y)
-        self.image = load_image(WALL_SPRITE)
-
-        # Bush is always unmovable and cannot be moved through
-        # Wall can be pushed
-        self._is_stop = False
-        self._is_push = False
+        self.sprite = (WALL_SPRITE, False)
 
     def copy(self) -> 'Wall':
         """
@@ -430,16 +265,12 @@ class Wall(Character):
 
 
 class Rock(Character):
+    kind = KIND_IDS["Rock"]
 
     def __init__(self, x: int, y: int) -> None:
 
         super().__init__(x, y)
-        self.image = load_image(ROCK_SPRITE)
-
-        # Bush is always unmovable and cannot be moved through
-        # Rock can be moved
-        self._is_stop = True
-        self._is_push = False
+        self.sprite = (ROCK_SPRITE, False)
 
     def copy(self) -> 'Rock':
         """
@@ -452,14 +283,12 @@ class Rock(Character):
 
 
 class Flag(Character):
+    kind = KIND_IDS["Flag"]
 
     def __init__(self, x: int, y: int) -> None:
 
         super().__init__(x, y)
-        self.image = load_image(FLAG_SPRITE)
-
-        self._is_stop = False
-        self._is_push = False
+        self.sprite = (FLAG_SPRITE, False)
 
     def copy(self) -> 'Flag':
         """
@@ -474,14 +303,14 @@ class Bush(Actor):
     """
     Class representing the edges and unmovable objects in the game.
     """
+    kind = KIND_IDS["Bush"]
+
     def __init__(self, x: int, y: int) -> None:
 
         super().__init__(x, y)
-        self.image = load_image(BUSH_SPRITE)
-
-        # Bush is always unmovable and cannot be moved through
-        self._is_stop = True
-        self._is_push = False
+        # Bush is always unmovable and cannot be moved through (see
+        # DEFAULT_FLAGS)
+        self.sprite = (BUSH_SPRITE, False)
 
     def copy(self) -> 'Bush':
         """
@@ -508,9 +337,8 @@ class Block(Actor):
 
         super().__init__(x, y)
         self.word = word_
-        # Blocks are always pushable and cannot be moved through.
-        self._is_push = True
-        self._is_stop = False
+        # Blocks are always pushable (see DEFAULT_FLAGS).
+        self.kind = KIND_IDS[word_.strip().upper()]
 
     def copy(self) -> 'Block':
         """
@@ -528,7 +356,7 @@ class Subject(Block):
     def __init__(self, x, y, word_):
         super().__init__(x,y,word_)
 
-        self.image = load_image(WORDS_SPRITES[word_.lower()])
+        self.sprite = (WORDS_SPRITES[word_.lower()], False)
 
     def copy(self):
         '''
@@ -547,7 +375,7 @@ class Attribute(Block):
     """
     def __init__(self, x, y, word_):
         super().__init__(x,y,word_)
-        self.image = load_image(WORDS_SPRITES[word_.lower()])
+        self.sprite = (WORDS_SPRITES[word_.lower()], False)
 
     def copy(self):
         '''
@@ -559,19 +387,21 @@ class Attribute(Block):
 class Is(Block):
     """
     Class representing the Is blocks in the game.
+
+    Its sprite changes colour depending on how many rules it completes.
     """
 
     def __init__(self, x: int, y: int) -> None:
 
         super().__init__(x, y, " is")  # Note the space in " is"
-        self.image = load_image(IS_PURPLE)
+        self.sprite = (IS_PURPLE, False)
 
     def copy(self):
         '''
         Creates an identical copy of self and returns the new copy.
         '''
         block_is = Is(self.x, self.y)
-        block_is.image = self.image
+        block_is.sprite = self.sprite
         return block_is
 
     def update(self, up: Optional[Actor],
@@ -591,51 +421,37 @@ class Is(Block):
         # TODO Task 3: Complete this method.
         vert = ''
         horiz = ''
-        flag = 0
-        if left and right and type(left) != Bush and type(right)!= Bush:
+        if left and right and type(left) != Bush and type(right) != Bush:
             try:
-                if left.word in list(SUBJECTS.values()) and right.word in list(ATTRIBUTES.values()):
-                    flag = 1
-                    self.image = load_image(IS_LIGHT_BLUE)
+                if left.word in SUBJECTS.values() \
+                        and right.word in ATTRIBUTES.values():
                     horiz = left.word + ' is' + right.word
             except AttributeError:
-                self.image = load_image(IS_PURPLE)
-
-        else:
-            self.image = load_image(IS_PURPLE)
+                pass
 
         if up and down and type(up) != Bush and type(down) != Bush:
-            # print(type(up), up)
-            # print(Bush)
             try:
-                if up.word in list(SUBJECTS.values()) and down.word in list(ATTRIBUTES.values()):
-                    if flag == 1:
-                        self.image = load_image(IS_DARK_BLUE)
-                    else:
-                        self.image = load_image(IS_LIGHT_BLUE)
+                if up.word in SUBJECTS.values() \
+                        and down.word in ATTRIBUTES.values():
                     vert = up.word + ' is' + down.word
             except AttributeError:
-                self.image = load_image(IS_PURPLE)
+                pass
 
+        # Only swap the sprite when the colour actually changes
+        if horiz and vert:
+            colour = IS_DARK_BLUE
+        elif horiz or vert:
+            colour = IS_LIGHT_BLUE
         else:
-            if flag == 0:
-                self.image = load_image(IS_PURPLE)
+            colour = IS_PURPLE
+        if colour != self.sprite[0]:
+            self.sprite = (colour, False)
         return horiz, vert
 
 
-def load_image(img_name: str, width: int = TILESIZE,
-               height: int = TILESIZE) -> pygame.image:
-    """
-    Return a pygame img of the PNG img_name that has been scaled according
-    to the given width and size
-    """
-    img = pygame.image.load(img_name).convert_alpha()
-    return pygame.transform.scale(img, (width, height))
-
-
 if __name__ == "__main__":
 
     import python_ta
     python_ta.check_all(config={
-        'extra-imports': ['settings', 'stack', 'actor', 'pygame']
+        'extra-imports': ['settings', 'stack', 'actor']
     })
@@ -0,0 +1,281 @@
+import hashlib
+import io
+import json
+import math
+import os
+import pygame
+from typing import Dict, List, Optional, Tuple
+from settings import *
+
+
+class SpriteCache:
+    """A process-wide cache of decoded and scaled sprites.
+
+    Decoding a PNG and rescaling it is by far the most expensive thing an
+    actor does, so every sprite is loaded from disk once per
+    (path, width, height) and the resulting Surface is shared by every actor
+    that asks for it. Shared surfaces must therefore never be drawn on.
+
+    Once an atlas is in use, tile-sized sprites packed in it are handed out
+    as subsurfaces of the atlas instead, so all of them come from a single
+    decode and share one block of pixels. The atlas itself is only read when
+    the first tile is asked for.
+
+    Other sprites, such as the background, are read from the disk cache of
+    pre-scaled sprites when it has them (see load_scaled).
+
+    === Private Attributes ===
+    _surfaces:
+        Maps (path, width, height, flipped) to the loaded Surface
+    _atlas:
+        The atlas image, or None if no atlas is in use
+    _pending:
+        The paths of the atlas and its index, until the atlas is read
+    _regions:
+        Maps the path of each sprite packed in the atlas to its rectangle
+    _hits:
+        Number of lookups answered from the cache
+    _misses:
+        Number of lookups that had to load the image from disk
+    """
+    _surfaces: Dict[Tuple[str, int, int, bool], pygame.Surface]
+    _atlas: Optional[pygame.Surface]
+    _pending: Optional[Tuple[str, str]]
+    _regions: Dict[str, pygame.Rect]
+    _hits: int
+    _misses: int
+
+    def __init__(self) -> None:
+        """Initialize a new empty cache."""
+        self._surfaces = {}
+        self._atlas = None
+        self._pending = None
+        self._regions = {}
+        self._hits = 0
+        self._misses = 0
+
+    def use_atlas(self, path: str = ATLAS_PATH,
+                  index_path: str = ATLAS_INDEX) -> None:
+        """Serve tile-sized sprites from the atlas at <path>, whose index is
+        at <index_path>.
+
+        Nothing is read until the first tile-sized sprite is asked for.
+        """
+        self._pending = (path, index_path)
+        self._surfaces.clear()
+
+    def _load_atlas(self) -> None:
+        """Read the atlas given to use_atlas.
+
+        The atlas is built first if it is missing or older than any of the
+        sprites; if it cannot be saved, the one built in memory is used.
+        """
+        path, index_path = self._pending
+        self._pending = None
+        if _atlas_is_stale(path, index_path):
+            atlas, index = build_atlas()
+            try:
+                save_atlas(atlas, index, path, index_path)
+            except (OSError, pygame.error):
+                pass
+        else:
+            atlas = pygame.image.load(path)
+            with open(index_path) as f:
+                index = json.load(f)
+        self._atlas = atlas.convert_alpha()
+        self._regions = {
+            "{}/{}".format(SPRITES_DIR, name): pygame.Rect(x, y, TILESIZE,
+                                                           TILESIZE)
+            for name, (x, y) in index['sprites'].items()}
+
+    def get(self, path: str, width: int = TILESIZE, height: int = TILESIZE,
+            flipped: bool = False) -> pygame.Surface:
+        """Return the sprite at <path> scaled to width x height, loading it
+        on the first request only.
+
+        If <flipped> is True, the sprite is mirrored horizontally.
+        """
+        key = (path, width, height, flipped)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._hits += 1
+            return surface
+
+        self._misses += 1
+        if self._pending is not None and (width, height) == (TILESIZE,
+                                                             TILESIZE):
+            self._load_atlas()
+        region = self._regions.get(path)
+        if flipped:
+            surface = pygame.transform.flip(self.get(path, width, height),
+                                            True, False)
+        elif region is not None and (width, height) == region.size:
+            surface = self._atlas.subsurface(region)
+        else:
+            surface = load_scaled(path, width, height)
+        self._surfaces[key] = surface
+        return surface
+
+    def loads(self) -> int:
+        """Return the number of sprites loaded or cut out of the atlas so
+        far.
+        """
+        return self._misses
+
+    def clear(self) -> None:
+        """Drop every cached sprite and the atlas, and reset the counters.
+        """
+        self._surfaces.clear()
+        self._atlas = None
+        self._pending = None
+        self._regions = {}
+        self._hits = 0
+        self._misses = 0
+
+    def memory(self) -> int:
+        """Return the approximate number of bytes held by the cached sprites.
+        Sprites that share the pixels of the atlas are counted once.
+        """
+        surfaces = [s for s in self._surfaces.values()
+                    if s.get_parent() is None]
+        if self._atlas is not None:
+            surfaces.append(self._atlas)
+        return sum(s.get_width() * s.get_height() * s.get_bytesize()
+                   for s in surfaces)
+
+    def report(self) -> Dict[str, float]:
+        """Return the number of cached sprites, their memory footprint in
+        bytes, and the hits, misses and hit rate of the lookups so far.
+        """
+        lookups = self._hits + self._misses
+        return {
+            'sprites': len(self._surfaces),
+            'bytes': self.memory(),
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_rate': self._hits / lookups if lookups else 0.0,
+        }
+
+
+def load_scaled(path: str, width: int, height: int) -> pygame.Surface:
+    """Return the image at <path> scaled to width x height, in the format
+    of the display.
+
+    Scaled images are kept in CACHE_DIR as raw pixels, under the hash of the
+    source file, TILESIZE and the size, so that later runs skip decoding
+    and scaling; an edited image gets a new entry. The cache is skipped if
+    it cannot be written.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    cache_path = "{}/{}-{}-{}x{}.rgba".format(
+        CACHE_DIR, hashlib.sha1(data).hexdigest(), TILESIZE, width, height)
+    try:
+        with open(cache_path, 'rb') as f:
+            pixels = f.read()
+    except OSError:
+        pixels = b''
+    if len(pixels) == width * height * 4:
+        return pygame.image.frombuffer(pixels, (width, height),
+                                       'RGBA').convert_alpha()
+
+    img = pygame.image.load(io.BytesIO(data), path).convert_alpha()
+    if img.get_size() != (width, height):
+        img = pygame.transform.scale(img, (width, height))
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # write to a temporary file first, so that a process starting at
+        # the same time never reads half an entry
+        partial = "{}.{}".format(cache_path, os.getpid())
+        with open(partial, 'wb') as f:
+            f.write(pygame.image.tobytes(img, 'RGBA'))
+        os.replace(partial, cache_path)
+    except OSError:
+        pass
+    return img
+
+
+def tile_sprites() -> List[str]:
+    """Return the file names of the tile sprites in SPRITES_DIR, i.e. every
+    PNG but the background and the atlases.
+    """
+    background = os.path.basename(BACKGROUND_SPRITE)
+    return sorted(name for name in os.listdir(SPRITES_DIR)
+                  if name.endswith(".png") and name != background
+                  and not name.startswith("atlas"))
+
+
+def build_atlas(size: int = TILESIZE) -> Tuple[pygame.Surface, Dict]:
+    """Return an atlas with every tile sprite scaled to <size> x <size>,
+    packed in a square grid, and its index.
+
+    The index records the size of the tiles and the top left corner of each
+    sprite in the atlas, by file name.
+    """
+    names = tile_sprites()
+    columns = max(1, math.ceil(math.sqrt(len(names))))
+    rows = max(1, math.ceil(len(names) / columns))
+    atlas = pygame.Surface((columns * size, rows * size), pygame.SRCALPHA, 32)
+    sprites = {}
+    for i, name in enumerate(names):
+        img = pygame.image.load("{}/{}".format(SPRITES_DIR, name))
+        img = img.convert(atlas)
+        if img.get_size() != (size, size):
+            img = pygame.transform.scale(img, (size, size))
+        corner = ((i % columns) * size, (i // columns) * size)
+        # copy the pixels as they are rather than blending them onto the
+        # transparent atlas
+        atlas.blit(img, corner, special_flags=pygame.BLEND_RGBA_MAX)
+        sprites[name] = corner
+    return atlas, {'tilesize': size, 'sprites': sprites}
+
+
+def save_atlas(atlas: pygame.Surface, index: Dict, path: str = ATLAS_PATH,
+               index_path: str = ATLAS_INDEX) -> None:
+    """Write <atlas> to <path> and its <index> to <index_path>.
+
+    Each file is written to a temporary file in the same directory first,
+    then renamed over the old one, so that a game starting at the same time
+    never reads half an atlas. The index goes last, so it is never newer
+    than the atlas it describes.
+    """
+    partial = "{}.{}".format(path, os.getpid())
+    with open(partial, 'wb') as f:
+        # the name tells pygame the format to write
+        pygame.image.save(atlas, f, os.path.basename(path))
+    os.replace(partial, path)
+    partial = "{}.{}".format(index_path, os.getpid())
+    with open(partial, 'w') as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(partial, index_path)
+
+
+def _atlas_is_stale(path: str, index_path: str) -> bool:
+    """Return whether the atlas at <path> is missing, is for another
+    TILESIZE, or is older than one of the sprites.
+    """
+    try:
+        built = min(os.path.getmtime(path), os.path.getmtime(index_path))
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return True
+    if index.get('tilesize') != TILESIZE:
+        return True
+    names = tile_sprites()
+    if sorted(index.get('sprites', {})) != names:
+        return True
+    return any(os.path.getmtime("{}/{}".format(SPRITES_DIR, name)) > built
+               for name in names)
+
+
+# The cache shared by every actor in the process
+SPRITES = SpriteCache()
+
+
+if __name__ == "__main__":
+    pygame.init()
+    atlas_, index_ = build_atlas()
+    save_atlas(atlas_, index_)
+    print("packed {} sprites into {} ({}x{})".format(
+        len(index_['sprites']), ATLAS_PATH, *atlas_.get_size()))
@@ -0,0 +1,188 @@
+import time
+from typing import List, Sequence, Tuple
+import numpy as np
+from settings import *
+from engine import Engine
+from observation import CHANNELS
+
+# A game that lasts this many moves without being won or lost is ended
+MAX_STEPS = 200
+# Rewards for winning and for losing
+WIN_REWARD = 1.0
+LOSE_REWARD = -1.0
+
+
+class BatchEnv:
+    """Many independent games played in lockstep, for automated play and
+    agent training.
+
+    Each game is a headless Engine, so moves, pushes and rules behave
+    exactly as in the game. The state of the batch is kept in NumPy arrays
+    shared by all games: step takes one action per game, as an index in
+    DIRECTIONS, and fills the rewards and the done flags in place.
+
+    The observation of each game is the observation tensor of its engine
+    (see Engine.observation), which the engine keeps in its slice of the
+    shared array as actors move. Games on smaller maps are padded with
+    empty cells.
+
+    A game is done when it is won, when it is lost (no player is left) or
+    after <max_steps> moves. The next call of step puts a finished game
+    back at the start of its map and ignores its action.
+
+    === Public Attributes ===
+    max_steps:
+        The number of moves after which a game is ended
+    observations:
+        A read-only view of the observation of each game, of shape
+        (games, len(CHANNELS), rows, columns)
+    rewards:
+        The reward of each game for the last step
+    dones:
+        Whether each game ended on the last step
+    steps:
+        The number of moves of each game since it was last started
+
+    === Private Attributes ===
+    _engines:
+        The game of each index
+    _starts:
+        The snapshot of each game at the start of its map
+    _tensor:
+        The array holding the observations, written by the engines
+    """
+    max_steps: int
+    observations: np.ndarray
+    rewards: np.ndarray
+    dones: np.ndarray
+    steps: np.ndarray
+    _engines: List[Engine]
+    _starts: List[bytes]
+    _tensor: np.ndarray
+
+    def __init__(self, maps: Sequence[Sequence[str]],
+                 max_steps: int = MAX_STEPS) -> None:
+        """Initialize a batch with a game on each of <maps>, given as the
+        lines of the map.
+        """
+        self.max_steps = max_steps
+        self._engines = []
+        for lines in maps:
+            engine = Engine()
+            engine.load_map_lines(lines)
+            engine.new()
+            self._engines.append(engine)
+        self._starts = [engine.snapshot() for engine in self._engines]
+        count = len(self._engines)
+        rows = max(engine.y_tiles for engine in self._engines)
+        columns = max(engine.x_tiles for engine in self._engines)
+        self._tensor = np.zeros((count, len(CHANNELS), rows, columns),
+                                dtype=np.uint8)
+        for index, engine in enumerate(self._engines):
+            engine.observation(self._tensor[index, :, :engine.y_tiles,
+                                            :engine.x_tiles])
+        self.observations = self._tensor.view()
+        self.observations.flags.writeable = False
+        self.rewards = np.zeros(count, dtype=np.float32)
+        self.dones = np.zeros(count, dtype=np.bool_)
+        self.steps = np.zeros(count, dtype=np.int32)
+
+    @staticmethod
+    def copies(lines: Sequence[str], count: int,
+               max_steps: int = MAX_STEPS) -> 'BatchEnv':
+        """Return a batch of <count> games on the map <lines>."""
+        return BatchEnv([lines] * count, max_steps)
+
+    def __len__(self) -> int:
+        """Return the number of games in the batch."""
+        return len(self._engines)
+
+    def engine(self, index: int) -> Engine:
+        """Return the game at <index>."""
+        return self._engines[index]
+
+    def reset(self) -> np.ndarray:
+        """Put every game back at the start of its map and return the
+        observations.
+        """
+        for index in range(len(self._engines)):
+            self._reset(index)
+        self.rewards[:] = 0
+        self.dones[:] = False
+        return self.observations
+
+    def step(self, actions: Sequence[int]
+             ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Move the player of each game in the direction DIRECTIONS[action],
+        and return the observations, rewards and done flags.
+
+        The arrays returned are the ones of this batch, updated in place.
+        """
+        actions = np.asarray(actions)
+        if actions.shape != (len(self._engines),):
+            raise ValueError("expected one action per game, got shape {}"
+                             .format(actions.shape))
+        finished = np.flatnonzero(self.dones)
+        for index in finished:
+            self._reset(index)
+        self.rewards[:] = 0
+        self.dones[:] = False
+        self.steps += 1
+        self.steps[finished] = 0
+
+        running = np.ones(len(self._engines), dtype=np.bool_)
+        running[finished] = False
+        for index in np.flatnonzero(running):
+            engine = self._engines[index]
+            engine.step(DIRECTIONS[actions[index]])
+            if engine.has_won():
+                self.rewards[index] = WIN_REWARD
+                self.dones[index] = True
+            elif engine.player is None:
+                self.rewards[index] = LOSE_REWARD
+                self.dones[index] = True
+        self.dones |= running & (self.steps >= self.max_steps)
+        return self.observations, self.rewards, self.dones
+
+    def _reset(self, index: int) -> None:
+        """Put the game at <index> back at the start of its map."""
+        self._engines[index].restore(self._starts[index])
+        self.steps[index] = 0
+
+
+def throughput(env: BatchEnv, steps: int, seed: int = 0) -> float:
+    """Return the number of game moves per second made by <steps> steps of
+    <env> with random actions.
+    """
+    rng = np.random.default_rng(seed)
+    actions = rng.integers(0, len(DIRECTIONS), size=(steps, len(env)))
+    start = time.perf_counter()
+    for step_actions in actions:
+        env.step(step_actions)
+    return steps * len(env) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    import argparse
+    import mapgen
+    parser = argparse.ArgumentParser(
+        description="Measure the moves per second of a batch of games "
+                    "played with random actions.")
+    parser.add_argument("map", nargs="?", default=None,
+                        help="the map to play (default: a generated one)")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--size", type=int, default=12,
+                        help="side length of the generated map")
+    args = parser.parse_args()
+
+    if args.map is None:
+        map_lines = mapgen.generate(args.size, args.size, rules=2)
+    else:
+        with open(args.map) as f:
+            map_lines = f.read().split()
+    begin = time.perf_counter()
+    batch = BatchEnv.copies(map_lines, args.games)
+    loaded = time.perf_counter() - begin
+    print("{} games loaded in {:.2f}s, {:.0f} moves/s".format(
+        args.games, loaded, throughput(batch, args.steps)))
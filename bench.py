@@ -0,0 +1,301 @@
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+from settings import *
+from engine import Engine
+import actor
+import mapgen
+
+# Side lengths of the square maps the engine is timed on
+SIZES = (10, 50, 100, 250, 500)
+# Lengths of the rows of rocks pushed by the player
+CHAIN_LENGTHS = (1, 4, 16, 64, 256)
+# Fraction of the cells of a generated map holding a rock, wall or flag
+DENSITY = 0.1
+# A result this much slower than the baseline counts as a regression
+THRESHOLD = 0.10
+# Side length of the map the game is started on to time its startup
+STARTUP_SIZE = 20
+# Numbers of games stepped together by a BatchEnv
+BATCH_SIZES = (1, 64, 1024)
+
+# Run in a fresh interpreter: print the seconds spent importing the game
+# (pygame included), then from there to the first frame on screen
+STARTUP_SCRIPT = '''
+import time
+start = time.perf_counter()
+import os, sys
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+from game import Game
+imported = time.perf_counter()
+pygame.init()
+game = Game()
+game.load_map_lines(sys.argv[1].split())
+game.new()
+game._draw()
+print(imported - start, time.perf_counter() - imported)
+'''
+
+
+def bench_map(size: int, density: float = DENSITY, seed: int = 0) -> List[str]:
+    """
+    Return the lines of a generated <size> x <size> map with a rule for
+    about every 50 cells, and a rock, wall or flag in <density> of the rest.
+    """
+    return mapgen.generate(size, size, seed, rules=size * size // 50,
+                           density=density)
+
+
+def chain_map(length: int) -> List[str]:
+    """
+    Return the lines of a map in which Meepo stands left of a row of
+    <length> pushable rocks with room to push them one cell.
+    """
+    width = length + 5
+    return ['1' * width,
+            '1' + "MIY.RIP".ljust(width - 2, '.') + '1',
+            '12' + '4' * length + '..1',
+            '1' * width]
+
+
+def load(lines: List[str], cls: Callable[[], Engine] = Engine) -> Engine:
+    """
+    Return a new engine of class <cls> playing the map <lines>.
+    """
+    engine = cls()
+    engine.load_map_lines(lines)
+    engine.new()
+    return engine
+
+
+def best(func: Callable[[], None], number: int, repeat: int) -> float:
+    """
+    Return the best time in seconds of one call of <func>, out of <repeat>
+    rounds of <number> calls.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return min(times)
+
+
+def bench_get_actor(size: int, repeat: int) -> float:
+    """
+    Time Engine.get_actor on random cells of a <size> x <size> map.
+    """
+    engine = load(bench_map(size))
+    rng = random.Random(1)
+    cells = [(rng.randrange(size), rng.randrange(size)) for _ in range(1000)]
+
+    def lookups() -> None:
+        for x, y in cells:
+            engine.get_actor(x, y)
+    return best(lookups, 10, repeat) / len(cells)
+
+
+def bench_push(length: int, repeat: int) -> Dict[str, float]:
+    """
+    Time a step pushing a row of <length> rocks, and its undo.
+    """
+    engine = load(chain_map(length))
+    steps, undos = [], []
+    for _ in range(repeat):
+        for _ in range(20):
+            start = time.perf_counter()
+            engine.step(RIGHT)
+            middle = time.perf_counter()
+            engine.undo()
+            steps.append(middle - start)
+            undos.append(time.perf_counter() - middle)
+    return {"push/{}".format(length): min(steps),
+            "undo/{}".format(length): min(undos)}
+
+
+def bench_update(size: int, repeat: int) -> float:
+    """
+    Time re-checking every rule of a <size> x <size> map.
+    """
+    engine = load(bench_map(size))
+    cells = [(is_.x, is_.y) for is_ in engine._is]
+
+    def update() -> None:
+        engine._dirty.update(cells)
+        engine._update()
+    return best(update, 5, repeat)
+
+
+def bench_change_property(size: int, repeat: int) -> float:
+    """
+    Time setting and unsetting a property of every wall of a <size> x <size>
+    map.
+    """
+    engine = load(bench_map(size))
+
+    def toggle() -> None:
+        engine.change_property(actor.Wall, 'isLose', "was set")
+        engine.change_property(actor.Wall, 'isLose')
+    return best(toggle, 5, repeat) / 2
+
+
+def bench_draw(size: int, repeat: int) -> Dict[str, float]:
+    """
+    Time a full redraw of a <size> x <size> map, and a frame after a step,
+    with the SDL dummy video driver.
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from game import Game
+    pygame.init()
+    game = load(bench_map(size), Game)
+
+    def full() -> None:
+        game._renderer.invalidate()
+        game._draw()
+
+    def step() -> None:
+        game.step(DOWN)
+        game._draw()
+        game.undo()
+        game._draw()
+    results = {"draw_full/{}".format(size): best(full, 3, repeat),
+               "draw_step/{}".format(size): best(step, 10, repeat) / 2}
+    pygame.display.quit()
+    return results
+
+
+def bench_startup(repeat: int) -> Dict[str, float]:
+    """
+    Time starting the game on a generated map in a new process, split into
+    importing the game and getting from there to the first frame. The first
+    run fills the caches on disk, so the best run is a start with warm
+    caches.
+    """
+    imports, frames = [], []
+    lines = "\n".join(bench_map(STARTUP_SIZE))
+    for _ in range(repeat + 1):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, lines], check=True,
+            stdout=subprocess.PIPE, universal_newlines=True,
+            env=dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")).stdout
+        imported, first_frame = output.split()
+        imports.append(float(imported))
+        frames.append(float(first_frame))
+    return {"startup/import": min(imports),
+            "startup/first_frame": min(frames)}
+
+
+def bench_batch(games: int, repeat: int) -> float:
+    """
+    Time a step of a BatchEnv of <games> games on a generated map with
+    random actions, per game.
+    """
+    import numpy as np
+    from batch import BatchEnv
+    env = BatchEnv.copies(bench_map(10), games)
+    rng = np.random.default_rng(0)
+    actions = rng.integers(0, len(DIRECTIONS), size=(50, games))
+    steps = iter(actions.tolist() * (repeat + 1))
+
+    def step() -> None:
+        env.step(next(steps))
+    return best(step, 50, repeat) / games
+
+
+def run(sizes: List[int], draw_sizes: List[int], chains: List[int],
+        repeat: int, startup: bool = True,
+        batches: List[int] = BATCH_SIZES) -> Dict[str, float]:
+    """
+    Run every benchmark and return the best seconds per operation, by name.
+    """
+    results = {}
+    for size in sizes:
+        results["get_actor/{}".format(size)] = bench_get_actor(size, repeat)
+        results["update/{}".format(size)] = bench_update(size, repeat)
+        results["change_property/{}".format(size)] = \
+            bench_change_property(size, repeat)
+    for length in chains:
+        results.update(bench_push(length, repeat))
+    for size in draw_sizes:
+        results.update(bench_draw(size, repeat))
+    for games in batches:
+        results["batch_step/{}".format(games)] = bench_batch(games, repeat)
+    if startup:
+        results.update(bench_startup(repeat))
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float],
+            threshold: float = THRESHOLD) -> List[str]:
+    """
+    Print how each result compares with the same one in <baseline>, and
+    return the names of those that are more than <threshold> slower.
+    """
+    regressions = []
+    for name, seconds in results.items():
+        old = baseline.get(name)
+        if old is None:
+            print("{:28} {:12.3f}us        (new)".format(name, seconds * 1e6))
+            continue
+        ratio = seconds / old if old > 0 else float('inf')
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  REGRESSION"
+            regressions.append(name)
+        print("{:28} {:12.3f}us  x{:.2f}{}".format(name, seconds * 1e6,
+                                                  ratio, mark))
+    return regressions
+
+
+def _report(results: Dict[str, float]) -> Dict[str, object]:
+    """
+    Return <results> with a description of the machine that produced them.
+    """
+    return {"python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results}
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Time the hot paths of the game on generated maps.")
+    parser.add_argument("--sizes", type=int, nargs="*", default=list(SIZES))
+    parser.add_argument("--draw-sizes", type=int, nargs="*",
+                        default=list(SIZES))
+    parser.add_argument("--chains", type=int, nargs="*",
+                        default=list(CHAIN_LENGTHS))
+    parser.add_argument("--batches", type=int, nargs="*",
+                        default=list(BATCH_SIZES),
+                        help="numbers of games stepped together")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-startup", action="store_true",
+                        help="do not time the startup of the game")
+    parser.add_argument("--output", metavar="FILE",
+                        help="write the results to FILE as JSON")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="compare with the results saved in FILE")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.draw_sizes, args.chains, args.repeat,
+                  not args.no_startup, args.batches)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(_report(results), f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+    else:
+        for name, seconds in results.items():
+            print("{:28} {:12.3f}us".format(name, seconds * 1e6))
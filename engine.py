@@ -0,0 +1,664 @@
+from typing import Any, Dict, Iterable, Type, Tuple, List, Set, Optional
+from settings import *
+from history import Delta, History
+from grid import Grid
+from observation import ObservationGrid
+import state
+import actor
+
+
+class Engine:
+    """
+    Class representing the rules of the game, without any window.
+
+    The engine owns the stage and implements movement, pushing, the rules
+    formed by the word blocks, undo and winning/losing. It never imports
+    pygame, so it can be used for simulations and tests; Game draws it on the
+    screen and feeds it key presses.
+    """
+    x_tiles: int
+    y_tiles: int
+    tiles_number: Tuple[int, int]
+
+    _actors: List[actor.Actor]
+    _pieces: List[actor.Actor]
+    _off_stage: Set[actor.Actor]
+    _by_kind: Dict[int, List[actor.Actor]]
+    _win_cells: Dict[Tuple[int, int], int]
+    _lose_cells: Dict[Tuple[int, int], int]
+    _is: List[actor.Is]
+    _running: bool
+    _won: bool
+    _rules: List[str]
+    _flags: List[int]
+    _history: History
+    _grid: Grid
+    _delta: Optional[Delta]
+    _dirty: Set[Tuple[int, int]]
+    _changed: Set[Tuple[int, int]]
+    _is_rules: Dict[actor.Is, Tuple[str, str]]
+    _rule_sources: Dict[str, int]
+    _hash: int
+    _observation: Optional[ObservationGrid]
+
+    player: Optional[actor.Actor]
+    map_data: List[str]
+
+    def __init__(self) -> None:
+        """
+        Initialize variables for this Class.
+        """
+        self.x_tiles, self.y_tiles = (0, 0)
+        self.tiles_number = (self.x_tiles, self.y_tiles)
+
+        self._actors = []
+        # Every actor that can move or leave the stage (i.e. all but the
+        # bushes) in a fixed order, and those that have left the stage
+        self._pieces = []
+        self._off_stage = set()
+        # The actors on the stage of each kind, in the order of _actors
+        self._by_kind = {}
+        # The number of victories and of loses on the stage in each cell
+        # that has any
+        self._win_cells = {}
+        self._lose_cells = {}
+        self._is = []
+        self._running = True
+        self._won = False
+        self._rules = []
+        # The flags of every kind of actor, shared by the actors as their
+        # table of flags
+        self._flags = list(DEFAULT_FLAGS)
+        self._history = History(self._pieces)
+        self._grid = Grid()
+        # The delta of the move being played, still open to rule changes
+        self._delta = None
+        # Cells whose occupancy changed since the last _update
+        self._dirty = set()
+        # Cells whose occupant or sprite changed since the last take_changed
+        self._changed = set()
+        # The (horizontal, vertical) rules completed by each Is tile, and
+        # the number of tiles completing each rule
+        self._is_rules = {}
+        self._rule_sources = {}
+        # Zobrist hash of the pieces on the stage and the active rules
+        self._hash = 0
+        # The observation tensor of the grid, once asked for
+        self._observation = None
+
+        self.player = None
+        self.map_data = []
+
+    def load_map(self, path: str) -> None:
+        """
+        Reads a .txt file representing the map
+        """
+        with open(path, 'rt') as f:
+            self.load_map_lines(f)
+
+    def load_map_lines(self, lines: Iterable[str]) -> None:
+        """
+        Reads the lines of a map in the same format as the .txt files
+        """
+        for line in lines:
+            self.map_data.append(line.strip())
+
+        self.x_tiles, self.y_tiles = len(self.map_data[0]), len(self.map_data)
+
+    def new(self) -> None:
+        """
+        Create the actors described by the map.
+        """
+        for col, tiles in enumerate(self.map_data):
+            for row, tile in enumerate(tiles):
+                if tile.isnumeric():
+                    self._actors.append(
+                        Engine.get_character(CHARACTERS[tile])(row, col))
+                elif tile in SUBJECTS:
+                    self._actors.append(
+                        actor.Subject(row, col, SUBJECTS[tile]))
+                elif tile in ATTRIBUTES:
+                    self._actors.append(
+                        actor.Attribute(row, col, ATTRIBUTES[tile]))
+                elif tile == 'I':
+                    is_tile = actor.Is(row, col)
+                    self._is.append(is_tile)
+                    self._actors.append(is_tile)
+        self._pieces = [actor_ for actor_ in self._actors
+                        if not isinstance(actor_, actor.Bush)]
+        self._history = History(self._pieces)
+        for actor_ in self._actors:
+            actor_._flags = self._flags
+            self._by_kind.setdefault(actor_.kind, []).append(actor_)
+        for actor_ in self._actors:
+            self._grid.add(actor_)
+        # every Is tile needs checking once to find the initial rules
+        self._dirty.update((is_.x, is_.y) for is_ in self._is)
+        self._update()
+        self._hash = self._compute_hash()
+
+    def get_actors(self) -> List[actor.Actor]:
+        """
+        Getter for the list of actors
+        """
+        return self._actors
+
+    def get_running(self) -> bool:
+        """
+        Getter for _running
+        """
+        return self._running
+
+    def get_rules(self) -> List[str]:
+        """
+        Getter for _rules
+        """
+        return self._rules
+
+    def players(self, direction: Tuple[int, int] = (0, 0)
+                ) -> List[actor.Actor]:
+        """
+        Return every actor controlled by the keys: the actors on the stage of
+        every kind that is "You". They are sorted for a move in <direction>,
+        the farthest ahead first, so that none of them walks into or pushes
+        one that has yet to move; ties are broken by kind, then by the order
+        of the list of actors.
+        """
+        players = [player for kind, bits in enumerate(self._flags)
+                   if bits & BIT_PLAYER
+                   for player in self._by_kind.get(kind, ())]
+        dx, dy = direction
+        if dx or dy:
+            return sorted(players, key=lambda p: -(p.x * dx + p.y * dy))
+        return list(players)
+
+    def observation(self, out: Optional[Any] = None) -> Any:
+        """
+        Return a read-only NumPy view of the observation tensor of the grid,
+        of shape (channels, y_tiles, x_tiles): a one-hot channel per kind of
+        actor, then one per flag of the active rules (see ObservationGrid).
+
+        The first call builds the tensor, in <out> if given, and from then on
+        every move updates it in place, so the view returned never needs
+        asking for again.
+        """
+        if self._observation is None:
+            grid = ObservationGrid(self.x_tiles, self.y_tiles, out)
+            for actor_ in self._actors:
+                grid.add(actor_.kind, self._flags[actor_.kind], actor_.x,
+                         actor_.y, 1)
+            self._observation = grid
+        return self._observation.view()
+
+    def has_won(self) -> bool:
+        """
+        Return whether the player has reached a victory
+        """
+        return self._won
+
+    def take_changed(self) -> Set[Tuple[int, int]]:
+        """
+        Return the positions whose occupant or sprite changed since the last
+        call, and start collecting afresh
+        """
+        changed = self._changed
+        self._changed = set()
+        return changed
+
+    def step(self, direction: Tuple[int, int]) -> bool:
+        """
+        Move every player one tile in <direction>, given as (dx, dy), pushing
+        whatever is in the way, in the order of players. Then check if the
+        game has been won or lost, and apply the rules that the move made or
+        broke.
+
+        Return whether any player actually moved.
+        """
+        if self.player is None or not self._running:
+            return False
+        assert isinstance(self.player, actor.Character)
+        dx, dy = direction
+        # record only what this move changes
+        self._delta = Delta(self.player)
+        moved = False
+        for player in self.players(direction):
+            # the sprite may change even if the player is stuck
+            self._changed.add((player.x, player.y))
+            if player.player_move(self, dx, dy):
+                moved = True
+        if not moved:
+            self._delta = None
+            return False
+        self._history.push(self._delta)
+        self.win_or_lose()
+        self._update()
+        return True
+
+    def snapshot(self) -> bytes:
+        """
+        Return the current state of the game in the compact encoding of
+        state.encode, which can be given back to restore. Bushes never move,
+        so they are left out.
+        """
+        if self.player is None:
+            player = -1
+        else:
+            player = self._pieces.index(self.player)
+        return state.encode(self._pieces, self._off_stage, player, self._rules,
+                            self._flags)
+
+    def restore(self, snapshot: bytes) -> None:
+        """
+        Put the game back in a state returned by snapshot. Only the actors
+        whose place differs are moved, and the undo history is cleared.
+        """
+        player, rules, flags, pieces = state.decode(snapshot)
+        self._delta = None
+        for kind, bits in enumerate(flags):
+            self._set_flags(kind, bits)
+        for actor_, (x, y, off_stage) in zip(self._pieces, pieces):
+            on_stage = actor_ not in self._off_stage
+            if off_stage:
+                if on_stage:
+                    self._leave(actor_)
+                continue
+            if not on_stage:
+                self._enter(actor_)
+            if actor_.x != x or actor_.y != y:
+                self._place(actor_, x, y)
+        self.set_player(self._pieces[player] if player >= 0 else None)
+        for rule in self._rules:
+            self._hash ^= state.ZOBRIST.rule(rule)
+        self._rules = rules
+        for rule in self._rules:
+            self._hash ^= state.ZOBRIST.rule(rule)
+        # bring the Is tiles back in line with the restored rules
+        self._evaluate_rules()
+        self._history.clear()
+        self._running = True
+        self._won = False
+
+    def state_hash(self) -> int:
+        """
+        Return the 64-bit Zobrist hash of the current state of the game.
+        Equal states have equal hashes, whichever moves led to them.
+        """
+        if self.player is None:
+            return self._hash
+        return self._hash ^ state.ZOBRIST.player(self.player.kind,
+                                                 self.player.x, self.player.y)
+
+    def _compute_hash(self) -> int:
+        """
+        Return the Zobrist hash of the pieces on the stage, the flags of
+        every kind and the active rules, computed from scratch (without the
+        player).
+        """
+        value = 0
+        for actor_ in self._pieces:
+            if actor_ not in self._off_stage:
+                value ^= self._key(actor_)
+        for kind, bits in enumerate(self._flags):
+            value ^= state.ZOBRIST.flags(kind, bits)
+        for rule in self._rules:
+            value ^= state.ZOBRIST.rule(rule)
+        return value
+
+    @staticmethod
+    def _key(actor_: actor.Actor) -> int:
+        """
+        Return the Zobrist key of <actor_> in its current cell
+        """
+        return state.ZOBRIST.piece(actor_.kind, actor_.x, actor_.y)
+
+    def win_or_lose(self) -> bool:
+        """
+        Check if the game has won or lost: every player standing on a lose is
+        taken off the stage, and the game is won as soon as a player reaches a
+        victory.
+        Returns True if the game is won or lost; otherwise return False
+        """
+        assert isinstance(self.player, actor.Character)
+        ended = False
+        for player in self.players():
+            cell = (player.x, player.y)
+            win = cell in self._win_cells
+            lose = cell in self._lose_cells
+            if win and lose:
+                # the lowest of them in the cell decides
+                for ac in self.get_actors_at(player.x, player.y):
+                    bits = ac.flag_bits()
+                    if bits & (BIT_WIN | BIT_LOSE):
+                        win = bits & BIT_WIN != 0
+                        break
+            if win:
+                self.win()
+                return True
+            elif lose:
+                self.lose(player)
+                ended = True
+        return ended
+
+    def set_player(self, actor_: Optional[actor.Actor]) -> None:
+        """
+        Takes an actor and sets that actor to be the player
+        """
+        self.player = actor_
+
+    def remove_player(self, actor_: actor.Actor) -> None:
+        """
+        Remove the given <actor> from the game's list of actors. If it was
+        the player, another player takes over (see _next_player).
+        """
+        self._leave(actor_)
+        if self._delta is not None:
+            self._delta.record_removal(actor_)
+        if actor_ is self.player:
+            self.set_player(self._next_player(actor_.kind))
+
+    def _next_player(self, kind: int) -> Optional[actor.Actor]:
+        """
+        Return the actor to follow as the player when the player of <kind>
+        is gone or is no longer "You": the last actor on the stage of <kind>
+        if its kind is still "You", else the last of the other players, or
+        None if nothing is controlled any more
+        """
+        remaining = self._by_kind.get(kind)
+        if remaining and self._flags[kind] & BIT_PLAYER:
+            return remaining[-1]
+        players = self.players()
+        return players[-1] if players else None
+
+    def _update(self) -> None:
+        """
+        Check the "Is" tiles next to the cells whose occupancy changed since
+        the last update to find what rules are added and which are removed if
+        any, and handle them accordingly.
+        """
+        if self._dirty:
+            added, removed = self._evaluate_rules()
+            if removed:
+                gone = set(removed)
+                self._rules = [rule for rule in self._rules
+                               if rule not in gone]
+                for deleted_rule in removed:
+                    self._hash ^= state.ZOBRIST.rule(deleted_rule)
+                    kind, attribute = RULE_TABLE[deleted_rule]
+                    self._apply_property(kind, attribute, False)
+            for new_rule in added:
+                self._rules.append(new_rule)
+                self._hash ^= state.ZOBRIST.rule(new_rule)
+                kind, attribute = RULE_TABLE[new_rule]
+                self._apply_property(kind, attribute, True)
+            if self._delta is not None:
+                self._delta.record_rules(added, removed)
+
+        self._delta = None
+
+    def _evaluate_rules(self) -> Tuple[List[str], List[str]]:
+        """
+        Re-check every "Is" tile in or next to a dirty cell and update how many
+        tiles complete each rule, then clear the dirty cells.
+
+        Return the rules that became active and the rules that stopped being
+        active, in the order the tiles were checked.
+        """
+        blocks = set()
+        for x, y in self._dirty:
+            for cell in ((x, y), (x, y - 1), (x, y + 1), (x - 1, y),
+                         (x + 1, y)):
+                for ac in self._grid.get_all(*cell):
+                    if isinstance(ac, actor.Is):
+                        blocks.add(ac)
+        self._dirty.clear()
+
+        # rules touched by this evaluation, with whether they were active
+        was_active = {}
+        for is_ in sorted(blocks, key=lambda b: (b.y, b.x)):
+            block_above_is = self.get_actor(is_.x, is_.y - 1)
+            block_under_is = self.get_actor(is_.x, is_.y + 1)
+            block_left_is = self.get_actor(is_.x - 1, is_.y)
+            block_right_is = self.get_actor(is_.x + 1, is_.y)
+
+            sprite = is_.sprite
+            found = is_.update(block_above_is, block_under_is,
+                               block_left_is, block_right_is)
+            if is_.sprite != sprite:
+                self._changed.add((is_.x, is_.y))
+            old = self._is_rules.get(is_, ('', ''))
+            if found == old:
+                continue
+            self._is_rules[is_] = found
+            for rule, change in ((old[0], -1), (old[1], -1),
+                                 (found[0], 1), (found[1], 1)):
+                if rule:
+                    count = self._rule_sources.get(rule, 0)
+                    was_active.setdefault(rule, count > 0)
+                    self._rule_sources[rule] = count + change
+
+        added, removed = [], []
+        for rule, active in was_active.items():
+            if self._rule_sources[rule] > 0 and not active:
+                added.append(rule)
+            elif self._rule_sources[rule] <= 0 and active:
+                removed.append(rule)
+        return added, removed
+
+    def change_property(self, subject: Optional[type], attribute: str,
+                        comment: str = "was deleted") -> None:
+        """
+        Give the <attribute> (e.g. 'isPush') to every actor of the class
+        <subject>, or take it away if <comment> is "was deleted"
+        """
+        if subject is not None:
+            self._apply_property(subject.kind, attribute,
+                                 comment != "was deleted")
+
+    def _apply_property(self, kind: int, attribute: str, given: bool) -> None:
+        """
+        Give the <attribute> to the actors of <kind>, or take it away if
+        <given> is False. See _set_flags for what this costs.
+        """
+        set_bits, clear_bits = PROPERTY_BITS[attribute, given]
+        self._set_flags(kind, self._flags[kind] & ~clear_bits | set_bits)
+        if attribute == 'isYou' and given:
+            # the last actor of the kind to enter the stage becomes the player
+            actors = self._by_kind.get(kind)
+            if actors:
+                self.set_player(actors[-1])
+        elif attribute == 'isYou' and self.player is not None \
+                and self.player.kind == kind:
+            self.set_player(self._next_player(kind))
+
+    def _set_flags(self, kind: int, bits: int) -> None:
+        """
+        Set the flags of every actor of <kind> to <bits>, recording the change
+        and updating the hash.
+
+        Flags belong to a kind, so the flags and the hash are updated in
+        constant time. The indexes built on the flags are not: gaining or
+        losing isVictory or isLose recounts the cell of every actor of the
+        kind, and so does any change of the flags while an observation is
+        kept (see observation).
+        """
+        old = self._flags[kind]
+        if old == bits:
+            return
+        if self._delta is not None:
+            self._delta.record_flags(kind, old)
+        self._hash ^= state.ZOBRIST.flags(kind, old) \
+            ^ state.ZOBRIST.flags(kind, bits)
+        for bit, cells in ((BIT_WIN, self._win_cells),
+                           (BIT_LOSE, self._lose_cells)):
+            if (old ^ bits) & bit:
+                change = 1 if bits & bit else -1
+                for actor_ in self._by_kind.get(kind, ()):
+                    _count(cells, (actor_.x, actor_.y), change)
+        if self._observation is not None:
+            self._observation.set_flags(
+                old, bits, ((actor_.x, actor_.y)
+                            for actor_ in self._by_kind.get(kind, ())))
+        self._flags[kind] = bits
+
+    @staticmethod
+    def get_character(subject: str) -> Optional[Type[Any]]:
+        """
+        Takes a string, returns appropriate class representing that string
+        """
+        if subject == "Meepo":
+            return actor.Meepo
+        elif subject == "Wall":
+            return actor.Wall
+        elif subject == "Rock":
+            return actor.Rock
+        elif subject == "Flag":
+            return actor.Flag
+        elif subject == "Bush":
+            return actor.Bush
+        return None
+
+    def undo(self) -> None:
+        """
+        Returns the game to a previous state by reverting the changes recorded
+        in the Delta at the top of the _history.
+        """
+        if not self._history.is_empty():
+            delta = self._history.pop()
+            for actor_ in delta.removed:
+                self._enter(actor_)
+            for actor_, x, y in reversed(delta.moves):
+                self._place(actor_, x, y)
+            for kind, bits in reversed(delta.flags):
+                self._set_flags(kind, bits)
+            added = set(delta.added_rules)
+            self._rules = [rule for rule in self._rules if rule not in added]
+            self._rules.extend(delta.removed_rules)
+            for rule in delta.added_rules + delta.removed_rules:
+                self._hash ^= state.ZOBRIST.rule(rule)
+            self.set_player(delta.player)
+            # bring the Is tiles back in line with the restored rules
+            self._evaluate_rules()
+
+        return
+
+    def get_actor(self, x: int, y: int) -> Optional[actor.Actor]:
+        """
+        Return the actor at the position x,y. If the slot is empty, Return None
+        """
+        return self._grid.get(x, y)
+
+    def get_actors_at(self, x: int, y: int) -> List[actor.Actor]:
+        """
+        Return all the actors stacked at the position x,y, bottom first.
+        If the slot is empty, return an empty list
+        """
+        return self._grid.get_all(x, y)
+
+    def move_actor(self, actor_: actor.Actor, x: int, y: int) -> None:
+        """
+        Move the given <actor_> to the position x,y, keeping the index of
+        occupied cells up to date
+        """
+        if self._delta is not None:
+            self._delta.record_move(actor_, actor_.x, actor_.y)
+        self._place(actor_, x, y)
+
+    def _place(self, actor_: actor.Actor, x: int, y: int) -> None:
+        """
+        Move <actor_> to the position x,y in the index of occupied cells,
+        marking both positions as changed and updating the hash
+        """
+        self._touch(actor_.x, actor_.y)
+        self._touch(x, y)
+        self._hash ^= self._key(actor_)
+        ends = self._flags[actor_.kind] & (BIT_WIN | BIT_LOSE)
+        if ends:
+            self._index_ends(actor_, -1)
+        if self._observation is not None:
+            self._observe(actor_, -1)
+        self._grid.move(actor_, x, y)
+        if ends:
+            self._index_ends(actor_, 1)
+        if self._observation is not None:
+            self._observe(actor_, 1)
+        self._hash ^= self._key(actor_)
+
+    def _enter(self, actor_: actor.Actor) -> None:
+        """
+        Put <actor_>, which had left the stage, back on it
+        """
+        self._actors.append(actor_)
+        self._by_kind.setdefault(actor_.kind, []).append(actor_)
+        self._grid.add(actor_)
+        self._off_stage.discard(actor_)
+        if self._observation is not None:
+            self._observe(actor_, 1)
+        self._index_ends(actor_, 1)
+        self._touch(actor_.x, actor_.y)
+        self._hash ^= self._key(actor_)
+
+    def _leave(self, actor_: actor.Actor) -> None:
+        """
+        Take <actor_> off the stage
+        """
+        self._actors.remove(actor_)
+        self._by_kind[actor_.kind].remove(actor_)
+        self._grid.remove(actor_)
+        self._off_stage.add(actor_)
+        if self._observation is not None:
+            self._observe(actor_, -1)
+        self._index_ends(actor_, -1)
+        self._touch(actor_.x, actor_.y)
+        self._hash ^= self._key(actor_)
+
+    def _index_ends(self, actor_: actor.Actor, change: int) -> None:
+        """
+        Add <change> to the number of victories, or of loses, in the cell of
+        <actor_> if it is one
+        """
+        bits = self._flags[actor_.kind]
+        if bits & BIT_WIN:
+            _count(self._win_cells, (actor_.x, actor_.y), change)
+        if bits & BIT_LOSE:
+            _count(self._lose_cells, (actor_.x, actor_.y), change)
+
+    def _observe(self, actor_: actor.Actor, change: int) -> None:
+        """
+        Add <change> to the count of <actor_> in its cell in the observation
+        tensor
+        """
+        self._observation.add(actor_.kind, self._flags[actor_.kind],
+                              actor_.x, actor_.y, change)
+
+    def _touch(self, x: int, y: int) -> None:
+        """
+        Mark the position x,y as changed, so that the rules around it are
+        re-checked and it is redrawn
+        """
+        self._dirty.add((x, y))
+        self._changed.add((x, y))
+
+    def win(self) -> None:
+        """
+        End the game.
+        """
+        self._running = False
+        self._won = True
+
+    def lose(self, char: actor.Character) -> None:
+        """
+        Lose the game by taking the player <char> off the stage
+        """
+        self.remove_player(char)
+
+
+def _count(cells: Dict[Tuple[int, int], int], cell: Tuple[int, int],
+           change: int) -> None:
+    """Add <change> to the count of <cell> in <cells>, dropping the cells
+    whose count falls to zero.
+    """
+    count = cells.get(cell, 0) + change
+    if count:
+        cells[cell] = count
+    else:
+        del cells[cell]
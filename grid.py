@@ -0,0 +1,111 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class Grid:
+    """A per-cell occupancy index of the actors on the stage.
+
+    Every actor is filed under the cell (x, y) it occupies, so looking up
+    what is in a cell does not have to scan the whole list of actors. Cells
+    can hold several actors at once (e.g. the player standing on a flag);
+    they are kept in the order in which the actors were added to the grid,
+    which is the order of the engine's list of actors, so that the bottom
+    actor of a cell is the first one of that list in the cell.
+
+    === Private Attributes ===
+    _cells:
+        Maps an (x, y) cell to the actors currently in it, bottom first.
+        Empty cells are not stored.
+    _ranks:
+        Maps each actor to the number of actors added to the grid before it
+    _added:
+        The number of actors added to the grid so far
+
+    Representation Invariant: every actor appears in exactly one cell, and
+    that cell is (actor.x, actor.y)
+    """
+    _cells: Dict[Tuple[int, int], List[Any]]
+    _ranks: Dict[Any, int]
+    _added: int
+
+    def __init__(self) -> None:
+        """Initialize a new empty grid."""
+        self._cells = {}
+        self._ranks = {}
+        self._added = 0
+
+    def __len__(self) -> int:
+        """Return the number of actors in this grid."""
+        return sum(len(stack) for stack in self._cells.values())
+
+    def clear(self) -> None:
+        """Remove every actor from this grid."""
+        self._cells.clear()
+        self._ranks.clear()
+
+    def add(self, actor_: Any) -> None:
+        """Put <actor_> on top of the cell it occupies, after every actor
+        already in the grid.
+        """
+        self._ranks[actor_] = self._added
+        self._added += 1
+        self._put(actor_)
+
+    def remove(self, actor_: Any) -> None:
+        """Take <actor_> out of the cell it occupies.
+
+        Raise a ValueError if <actor_> is not in that cell.
+        """
+        self._take(actor_)
+        del self._ranks[actor_]
+
+    def move(self, actor_: Any, x: int, y: int) -> None:
+        """Move <actor_> to the cell (x, y), updating its coordinates. It
+        keeps its place in the order of the actors.
+        """
+        if (actor_.x, actor_.y) == (x, y):
+            return
+        self._take(actor_)
+        actor_.x, actor_.y = x, y
+        self._put(actor_)
+
+    def get(self, x: int, y: int) -> Optional[Any]:
+        """Return the bottom actor in the cell (x, y), or None if it is empty.
+        """
+        stack = self._cells.get((x, y))
+        if stack:
+            return stack[0]
+        return None
+
+    def get_all(self, x: int, y: int) -> List[Any]:
+        """Return a copy of the stack of actors in the cell (x, y), bottom
+        first. The list is empty if the cell is empty.
+        """
+        return list(self._cells.get((x, y), ()))
+
+    def _put(self, actor_: Any) -> None:
+        """Put <actor_> in the cell it occupies, above the actors added to
+        the grid before it.
+        """
+        cell = (actor_.x, actor_.y)
+        stack = self._cells.get(cell)
+        if stack is None:
+            self._cells[cell] = [actor_]
+            return
+        rank = self._ranks[actor_]
+        index = len(stack)
+        while index and self._ranks[stack[index - 1]] > rank:
+            index -= 1
+        stack.insert(index, actor_)
+
+    def _take(self, actor_: Any) -> None:
+        """Take <actor_> out of the cell it occupies.
+
+        Raise a ValueError if <actor_> is not in that cell.
+        """
+        cell = (actor_.x, actor_.y)
+        stack = self._cells.get(cell)
+        if stack is None:
+            raise ValueError("actor is not in the grid")
+        stack.remove(actor_)
+        if not stack:
+            del self._cells[cell]
@@ -0,0 +1,261 @@
+import tempfile
+import zlib
+from array import array
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Sequence, \
+    Tuple
+from settings import *
+from stack import EmptyStackError
+from state import RULES, RULE_IDS
+
+# Deltas encoded and compressed together; twice as many are kept as they are
+BLOCK = 256
+
+
+class Delta:
+    """The changes made to the game by a single accepted move.
+
+    Instead of a snapshot of the whole game, only what the move touched is
+    kept, so recording a move costs time proportional to the push chain
+    rather than to the size of the map. Undoing the move replays these
+    changes in reverse (see Engine.undo).
+
+    === Public Attributes ===
+    player:
+        The player before the move was made
+    moves:
+        (actor, old x, old y) for every displacement, in the order they
+        happened
+    flags:
+        (kind, flags before the change) for every change of the flags of a
+        kind made by change_property, in the order they happened
+    added_rules:
+        Rules that became active because of the move
+    removed_rules:
+        Rules that stopped being active because of the move
+    removed:
+        Actors that were taken out of the game, e.g. a player that lost
+    """
+    player: Optional[Any]
+    moves: List[Tuple[Any, int, int]]
+    flags: List[Tuple[int, int]]
+    added_rules: List[str]
+    removed_rules: List[str]
+    removed: List[Any]
+
+    def __init__(self, player: Optional[Any]) -> None:
+        """Initialize an empty delta for a move made by <player>."""
+        self.player = player
+        self.moves = []
+        self.flags = []
+        self.added_rules = []
+        self.removed_rules = []
+        self.removed = []
+
+    def __len__(self) -> int:
+        """Return the number of individual changes recorded in this delta."""
+        return (len(self.moves) + len(self.flags) + len(self.added_rules)
+                + len(self.removed_rules) + len(self.removed))
+
+    def record_move(self, actor_: Any, x: int, y: int) -> None:
+        """Record that <actor_> is about to leave the cell (x, y)."""
+        self.moves.append((actor_, x, y))
+
+    def record_flags(self, kind: int, bits: int) -> None:
+        """Record the flags <bits> of <kind> before they are changed."""
+        self.flags.append((kind, bits))
+
+    def record_rules(self, added: List[str], removed: List[str]) -> None:
+        """Record the rules that were <added> and <removed> by the move."""
+        self.added_rules.extend(added)
+        self.removed_rules.extend(removed)
+
+    def record_removal(self, actor_: Any) -> None:
+        """Record that <actor_> was removed from the game."""
+        self.removed.append(actor_)
+
+    def encode(self, index: Dict[Any, int]) -> array:
+        """Return this delta as an array of integers, with every actor
+        replaced by its number in <index> and every rule by its id.
+        """
+        values = array('i', [-1 if self.player is None
+                             else index[self.player], len(self.moves)])
+        for actor_, x, y in self.moves:
+            values.extend((index[actor_], x, y))
+        values.append(len(self.flags))
+        for kind, bits in self.flags:
+            values.extend((kind, bits))
+        for rules in (self.added_rules, self.removed_rules):
+            values.append(len(rules))
+            values.extend(RULE_IDS[rule] for rule in rules)
+        values.append(len(self.removed))
+        values.extend(index[actor_] for actor_ in self.removed)
+        return values
+
+    @staticmethod
+    def decode(values: Iterator[int], pieces: Sequence[Any]) -> 'Delta':
+        """Return the delta encoded at the start of <values>, given the
+        actors numbered by <pieces>.
+        """
+        player = next(values)
+        delta = Delta(pieces[player] if player >= 0 else None)
+        for _ in range(next(values)):
+            delta.moves.append((pieces[next(values)], next(values),
+                                next(values)))
+        for _ in range(next(values)):
+            delta.flags.append((next(values), next(values)))
+        for rules in (delta.added_rules, delta.removed_rules):
+            for _ in range(next(values)):
+                rules.append(RULES[next(values)])
+        for _ in range(next(values)):
+            delta.removed.append(pieces[next(values)])
+        return delta
+
+
+class History:
+    """The undo history of a game: a stack of Deltas under a memory budget.
+
+    The last 2 * BLOCK deltas are kept as they are, so pushing and popping
+    them is O(1). Older ones are encoded BLOCK at a time into one
+    zlib-compressed block, and once the compressed blocks in memory take
+    more than <budget> bytes the oldest of them are spilled to a temporary
+    file. Popping past the recent deltas decompresses the newest block back
+    into BLOCK deltas, so every move can still be undone, back to the first
+    one, at an amortized O(1) per pop.
+
+    === Public Attributes ===
+    budget:
+        The most bytes of compressed blocks kept in memory
+
+    === Private Attributes ===
+    _pieces:
+        The actors that deltas can refer to, numbered by their position
+    _index:
+        The number of each actor of <_pieces>
+    _recent:
+        The deltas kept as they are, oldest first
+    _blocks:
+        The compressed blocks kept in memory, oldest first
+    _memory:
+        The number of bytes of <_blocks>
+    _spilled:
+        The (offset, size) in <_file> of every spilled block, oldest first
+    _file:
+        The file the blocks are spilled to, or None until the first spill
+    _count:
+        The number of deltas in the history
+    """
+    budget: int
+    _pieces: Sequence[Any]
+    _index: Dict[Any, int]
+    _recent: List[Delta]
+    _blocks: List[bytes]
+    _memory: int
+    _spilled: List[Tuple[int, int]]
+    _file: Optional[BinaryIO]
+    _count: int
+
+    def __init__(self, pieces: Sequence[Any],
+                 budget: int = HISTORY_BUDGET) -> None:
+        """Initialize an empty history of moves of the actors <pieces>,
+        keeping up to <budget> bytes of compressed deltas in memory.
+        """
+        self.budget = budget
+        self._pieces = pieces
+        self._index = {actor_: i for i, actor_ in enumerate(pieces)}
+        self._recent = []
+        self._blocks = []
+        self._memory = 0
+        self._spilled = []
+        self._file = None
+        self._count = 0
+
+    def __len__(self) -> int:
+        """Return the number of deltas in the history."""
+        return self._count
+
+    def is_empty(self) -> bool:
+        """Return whether the history holds no delta."""
+        return self._count == 0
+
+    def push(self, delta: Delta) -> None:
+        """Add <delta> to the top of the history."""
+        self._recent.append(delta)
+        self._count += 1
+        if len(self._recent) >= 2 * BLOCK:
+            self._freeze()
+
+    def pop(self) -> Delta:
+        """Remove and return the delta at the top of the history.
+
+        Raise an EmptyStackError if the history is empty.
+        """
+        if self._count == 0:
+            raise EmptyStackError
+        if not self._recent:
+            self._thaw()
+        self._count -= 1
+        return self._recent.pop()
+
+    def clear(self) -> None:
+        """Remove every delta and drop the spill file."""
+        self._recent = []
+        self._blocks = []
+        self._memory = 0
+        self._spilled = []
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._count = 0
+
+    def memory(self) -> Dict[str, int]:
+        """Return the number of deltas in the history and how many of them
+        are kept as they are, and the bytes of compressed blocks in memory
+        and in the spill file.
+        """
+        return {'deltas': self._count, 'recent': len(self._recent),
+                'compressed': self._memory,
+                'spilled': sum(size for _, size in self._spilled)}
+
+    def _freeze(self) -> None:
+        """Compress the oldest BLOCK recent deltas into a block, then spill
+        the oldest blocks until the rest fit in the budget.
+        """
+        values = array('i')
+        for delta in self._recent[:BLOCK]:
+            values.extend(delta.encode(self._index))
+        del self._recent[:BLOCK]
+        block = zlib.compress(values.tobytes())
+        self._blocks.append(block)
+        self._memory += len(block)
+        while self._memory > self.budget and self._blocks:
+            self._spill()
+
+    def _spill(self) -> None:
+        """Move the oldest block in memory to the end of the spill file."""
+        block = self._blocks.pop(0)
+        self._memory -= len(block)
+        if self._file is None:
+            self._file = tempfile.TemporaryFile()
+        offset = self._spilled[-1][0] + self._spilled[-1][1] \
+            if self._spilled else 0
+        self._file.seek(offset)
+        self._file.write(block)
+        self._spilled.append((offset, len(block)))
+
+    def _thaw(self) -> None:
+        """Decompress the newest block, from memory or else from the end of
+        the spill file, into the recent deltas.
+        """
+        if self._blocks:
+            block = self._blocks.pop()
+            self._memory -= len(block)
+        else:
+            offset, size = self._spilled.pop()
+            self._file.seek(offset)
+            block = self._file.read(size)
+            self._file.truncate(offset)
+        values = array('i')
+        values.frombytes(zlib.decompress(block))
+        stream = iter(values)
+        self._recent[:0] = [Delta.decode(stream, self._pieces)
+                            for _ in range(BLOCK)]
@@ -0,0 +1,229 @@
+import random
+from typing import List, Sequence
+from settings import *
+
+# Fraction of the free cells holding a rock, wall or flag
+DENSITY = 0.1
+# Rules that cannot stop Meepo from walking along the corridor to the flag
+SAFE_RULES = ("WIS", "WIP", "WIL", "RIS", "RIP", "RIL")
+# The rules every generated map starts with
+BASE_RULES = ("MIY", "FIV")
+PUSH_RULE = "RIP"
+# Attempts at finding room for each placed item before giving up
+ATTEMPTS = 200
+
+
+class MapGenerator:
+    """Generates maps in the format read by Engine.load_map.
+
+    Every map is enclosed by bushes. Its first row holds the rules "Meepo is
+    You" and "Flag is Victory" (and "Rock is Push" if there are push
+    chains), and the second row holds Meepo and, at the far end, a flag.
+    When the map must be solvable that row is kept empty in between and no
+    other rule can form by accident, so walking right always wins.
+
+    === Public Attributes ===
+    width, height:
+        The size of the map in cells
+    solvable:
+        Whether the map is guaranteed to be winnable
+
+    === Private Attributes ===
+    _rows:
+        The cells of the map being generated, by row
+    _rng:
+        The source of randomness
+    _header:
+        The column at which the next rule of the first row starts
+    """
+    width: int
+    height: int
+    solvable: bool
+    _rows: List[List[str]]
+    _rng: random.Random
+    _header: int
+
+    def __init__(self, width: int, height: int, seed: int = 0,
+                 solvable: bool = True,
+                 header: Sequence[str] = BASE_RULES) -> None:
+        """Initialize an empty <width> x <height> map enclosed by bushes,
+        with the rules <header> in its first row.
+
+        Raise a ValueError if the map is too small for its rules.
+        """
+        # each rule takes 3 cells and a gap, between two bushes
+        min_width = 4 * len(header) + 1
+        if width < min_width or height < 4:
+            raise ValueError("a map with {} rules in its first row must be "
+                             "at least {} x 4 cells".format(len(header),
+                                                            min_width))
+        self.width, self.height = width, height
+        self.solvable = solvable
+        self._rng = random.Random(seed)
+        self._rows = [['.'] * width for _ in range(height)]
+        for x in range(width):
+            self._rows[0][x] = self._rows[-1][x] = '1'
+        for y in range(height):
+            self._rows[y][0] = self._rows[y][-1] = '1'
+        self._rows[2][1] = '2'
+        self._rows[2][-2] = '5'
+        self._header = 1
+        for rule in header:
+            self.add_header_rule(rule)
+
+    def add_header_rule(self, rule: str) -> None:
+        """Write the 3-letter <rule> in the first row, after the others.
+
+        Raise a ValueError if there is no room left in that row.
+        """
+        if self._header + 3 > self.width - 1:
+            raise ValueError("no room for the rule {}".format(rule))
+        self._rows[1][self._header:self._header + 3] = list(rule)
+        self._header += 4
+
+    def add_rules(self, count: int) -> None:
+        """Write <count> random rules, across or down."""
+        sources = SAFE_RULES if self.solvable else [
+            subject + 'I' + attribute
+            for subject in SUBJECTS for attribute in ATTRIBUTES]
+        for _ in range(count):
+            rule = self._rng.choice(sources)
+            if self._rng.random() < 0.5:
+                self._place(rule, 1, 0, True)
+            else:
+                self._place(rule, 0, 1, True)
+
+    def add_words(self, count: int) -> None:
+        """Scatter <count> loose subject and attribute blocks."""
+        letters = list(SUBJECTS) + list(ATTRIBUTES)
+        for _ in range(count):
+            self._place(self._rng.choice(letters), 1, 0, True)
+
+    def add_is_blocks(self, count: int) -> None:
+        """Scatter <count> loose "Is" blocks."""
+        for _ in range(count):
+            self._place('I', 1, 0, True)
+
+    def add_chains(self, count: int, length: int) -> None:
+        """Lay <count> rows or columns of <length> rocks, and make rocks
+        pushable.
+        """
+        if count > 0 and PUSH_RULE not in self.header_rules():
+            self.add_header_rule(PUSH_RULE)
+        for _ in range(count):
+            if self._rng.random() < 0.5:
+                self._place('4' * length, 1, 0, False)
+            else:
+                self._place('4' * length, 0, 1, False)
+
+    def fill(self, density: float = DENSITY) -> None:
+        """Put a rock, wall or flag in each free cell below the second row
+        with probability <density>.
+        """
+        for row in self._rows[3:-1]:
+            for x in range(1, self.width - 1):
+                if row[x] == '.' and self._rng.random() < density:
+                    row[x] = self._rng.choice("345")
+
+    def header_rules(self) -> List[str]:
+        """Return the rules written in the first row."""
+        # each rule is followed by a gap, except a rule against the bushes
+        return ''.join(self._rows[1][1:self._header - 1]).split('.')
+
+    def lines(self) -> List[str]:
+        """Return the lines of the map."""
+        return [''.join(row) for row in self._rows]
+
+    def _place(self, text: str, dx: int, dy: int, words: bool) -> None:
+        """Write <text> in a free spot below the second row, going (dx, dy)
+        from its first cell.
+
+        Word blocks of a solvable map are only placed where no other word
+        block touches them, so they cannot complete a rule by accident.
+
+        Raise a ValueError if no room is found.
+        """
+        margin = 1 if words and self.solvable else 0
+        for _ in range(ATTEMPTS):
+            x = self._rng.randrange(1, self.width - 1)
+            y = self._rng.randrange(3, self.height - 1)
+            cells = [(x + i * dx, y + i * dy) for i in range(len(text))]
+            if all(self._free(cx, cy, margin) for cx, cy in cells):
+                for (cx, cy), char in zip(cells, text):
+                    self._rows[cy][cx] = char
+                return
+        raise ValueError("no room left for {}".format(text))
+
+    def _free(self, x: int, y: int, margin: int) -> bool:
+        """Return whether the cell (x, y) is an empty cell below the second
+        row, and, if <margin> is 1, no word block is next to it.
+        """
+        if not (1 <= x < self.width - 1 and 3 <= y < self.height - 1):
+            return False
+        if self._rows[y][x] != '.':
+            return False
+        if margin:
+            for cx, cy in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                if _is_word(self._rows[cy][cx]):
+                    return False
+        return True
+
+
+def _is_word(char: str) -> bool:
+    """Return whether <char> is the code of a word block."""
+    return char in SUBJECTS or char in ATTRIBUTES or char == 'I'
+
+
+def generate(width: int, height: int, seed: int = 0, rules: int = 0,
+             words: int = 0, is_blocks: int = 0, chains: int = 0,
+             chain_length: int = 4, density: float = DENSITY,
+             solvable: bool = True) -> List[str]:
+    """Return the lines of a random <width> x <height> map, the same for the
+    same arguments.
+
+    rules: the number of extra 3-block rules
+    words: the number of loose subject and attribute blocks
+    is_blocks: the number of loose "Is" blocks
+    chains: the number of rows or columns of <chain_length> pushable rocks
+    density: the fraction of the remaining cells holding a rock, wall or flag
+    solvable: whether Meepo must be able to win by walking right
+    """
+    header = BASE_RULES + ((PUSH_RULE,) if chains > 0 else ())
+    generator = MapGenerator(width, height, seed, solvable, header)
+    generator.add_chains(chains, chain_length)
+    generator.add_rules(rules)
+    generator.add_words(words)
+    generator.add_is_blocks(is_blocks)
+    generator.fill(density)
+    return generator.lines()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Generate a random map for the game.")
+    parser.add_argument("width", type=int)
+    parser.add_argument("height", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rules", type=int, default=0)
+    parser.add_argument("--words", type=int, default=0)
+    parser.add_argument("--is-blocks", type=int, default=0)
+    parser.add_argument("--chains", type=int, default=0)
+    parser.add_argument("--chain-length", type=int, default=4)
+    parser.add_argument("--density", type=float, default=DENSITY)
+    parser.add_argument("--unsolvable", action="store_true",
+                        help="allow any rule, even if it makes the map "
+                             "impossible to win")
+    parser.add_argument("--output", metavar="FILE",
+                        help="write the map to FILE instead of printing it")
+    args = parser.parse_args()
+
+    text = "\n".join(generate(args.width, args.height, args.seed, args.rules,
+                              args.words, args.is_blocks, args.chains,
+                              args.chain_length, args.density,
+                              not args.unsolvable)) + "\n"
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text, end='')
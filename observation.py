@@ -0,0 +1,107 @@
+from typing import Iterable, List, Optional, Tuple
+from settings import *
+
+try:
+    import numpy as np
+except ImportError:     # the observation is optional
+    np = None
+
+# The flags given a channel of their own, and the name of every channel: one
+# per kind of actor, then one per flag
+FLAG_BITS = (BIT_PLAYER, BIT_PUSH, BIT_STOP, BIT_LOSE, BIT_WIN)
+CHANNELS = list(KINDS) + ["is" + name
+                          for name in ("You", "Push", "Stop", "Lose",
+                                       "Victory")]
+
+
+class ObservationGrid:
+    """A one-hot tensor of the grid, kept up to date in place.
+
+    The tensor has a channel per kind of actor (see KINDS), with a 1 in every
+    cell holding an actor of that kind, then a channel per flag of FLAG_BITS,
+    with a 1 in every cell holding an actor that has the flag under the
+    active rules. Each actor is counted in its cell, so that a cell stays at 1
+    until the last actor it counts leaves; only the counts that go from or to
+    0 write to the tensor.
+
+    The grid needs NumPy; the engine only keeps one when asked to.
+
+    === Public Attributes ===
+    tensor:
+        The tensor, of shape (len(CHANNELS), rows, columns)
+
+    === Private Attributes ===
+    _counts:
+        The number of actors counted in each channel of each cell, flat in
+        the order of the tensor; reading a list is much faster than reading
+        an array one item at a time
+    _columns:
+        The number of columns of the grid
+    _rows:
+        The number of rows of the grid
+    """
+    tensor: 'np.ndarray'
+    _counts: List[int]
+    _columns: int
+    _rows: int
+
+    def __init__(self, columns: int, rows: int,
+                 out: Optional['np.ndarray'] = None) -> None:
+        """Initialize an empty grid of <columns> x <rows> cells, kept in
+        <out> if given, which must have the shape of the tensor.
+
+        Raise an ImportError if NumPy is not installed.
+        """
+        if np is None:
+            raise ImportError("the observation grid needs numpy")
+        shape = (len(CHANNELS), rows, columns)
+        if out is None:
+            out = np.zeros(shape, dtype=np.uint8)
+        elif out.shape != shape:
+            raise ValueError("expected an array of shape {}, got {}"
+                             .format(shape, out.shape))
+        else:
+            out[...] = 0
+        self.tensor = out
+        self._counts = [0] * out.size
+        self._columns, self._rows = columns, rows
+
+    def view(self) -> 'np.ndarray':
+        """Return a read-only view of the tensor."""
+        view = self.tensor.view()
+        view.flags.writeable = False
+        return view
+
+    def add(self, kind: int, bits: int, x: int, y: int, change: int) -> None:
+        """Count <change> more actors of <kind> with the flags <bits> in the
+        cell x,y.
+        """
+        self._count(kind, x, y, change)
+        if bits:
+            self.add_flags(bits, x, y, change)
+
+    def add_flags(self, bits: int, x: int, y: int, change: int) -> None:
+        """Count <change> more actors with each of the flags in <bits> in the
+        cell x,y.
+        """
+        for channel, bit in enumerate(FLAG_BITS, len(KINDS)):
+            if bits & bit:
+                self._count(channel, x, y, change)
+
+    def set_flags(self, old: int, bits: int,
+                  cells: Iterable[Tuple[int, int]]) -> None:
+        """Move an actor in each of <cells> from the flags <old> to the
+        flags <bits>.
+        """
+        lost, gained = old & ~bits, bits & ~old
+        for x, y in cells:
+            self.add_flags(lost, x, y, -1)
+            self.add_flags(gained, x, y, 1)
+
+    def _count(self, channel: int, x: int, y: int, change: int) -> None:
+        """Add <change> to the count of <channel> in the cell x,y."""
+        index = (channel * self._rows + y) * self._columns + x
+        before = self._counts[index]
+        self._counts[index] = before + change
+        if (before == 0) != (before + change == 0):
+            self.tensor[channel, y, x] = before == 0
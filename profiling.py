@@ -0,0 +1,288 @@
+import json
+import time
+from array import array
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from assets import SPRITES
+import actor
+import renderer
+
+# Number of spans and of frames kept; older ones are overwritten
+CAPACITY = 1 << 16
+# The methods of a Game timed on every call, and the per-frame counters
+SPANS = ('_events', '_handle', 'step', 'player_move', '_update',
+         '_apply_property', '_draw')
+COUNTERS = ('get_actor', 'image_loads', 'blits')
+PERCENTILES = (50, 90, 99)
+
+
+class Profiler:
+    """Opt-in timings of the phases of each frame of a Game.
+
+    Nothing in the game calls the profiler. Installing it replaces the
+    timed methods of one game (and Character.player_move) with wrappers
+    that record a span per call, and wraps Engine.get_actor and
+    renderer.image_of to count calls; uninstalling puts the originals back.
+    A game without a profiler therefore runs exactly the code it always
+    did.
+
+    A frame ends with each call of _draw, which the game makes once per
+    iteration of its loop, and starts with the first span after that, so
+    the time the game sleeps waiting for input is not counted.
+
+    Spans and frames are written to preallocated arrays used as ring
+    buffers: recording one is a few stores, never an allocation, and only
+    the last <capacity> of each are kept.
+
+    === Public Attributes ===
+    capacity:
+        The number of spans, and of frames, kept
+
+    === Private Attributes ===
+    _span_name, _span_start, _span_length, _span_frame:
+        The index in SPANS, start time, length in seconds and frame number
+        of each span, in a ring
+    _spans:
+        The number of spans recorded so far
+    _frame_start, _frame_length:
+        The start time and length in seconds of each frame, in a ring
+    _frame_counts:
+        The counters of each frame, len(COUNTERS) values per frame
+    _frames:
+        The number of frames recorded so far
+    _counts:
+        The counters of the frame in progress
+    _start:
+        The start time of the frame in progress, or None before its first
+        span
+    _loads:
+        The number of sprites the cache had loaded when the frame started
+    _installed:
+        The (owner, name, original) of every attribute replaced by install
+    """
+    capacity: int
+    _span_name: array
+    _span_start: array
+    _span_length: array
+    _span_frame: array
+    _spans: int
+    _frame_start: array
+    _frame_length: array
+    _frame_counts: array
+    _frames: int
+    _counts: List[int]
+    _start: Optional[float]
+    _loads: int
+    _installed: List[Tuple[Any, str, Any]]
+
+    def __init__(self, capacity: int = CAPACITY) -> None:
+        """Initialize a profiler keeping the last <capacity> spans and
+        frames.
+        """
+        self.capacity = capacity
+        self._span_name = array('B', bytes(capacity))
+        self._span_start = array('d', bytes(8 * capacity))
+        self._span_length = array('d', bytes(8 * capacity))
+        self._span_frame = array('q', bytes(8 * capacity))
+        self._spans = 0
+        self._frame_start = array('d', bytes(8 * capacity))
+        self._frame_length = array('d', bytes(8 * capacity))
+        self._frame_counts = array('q', bytes(8 * capacity * len(COUNTERS)))
+        self._frames = 0
+        self._counts = [0] * len(COUNTERS)
+        self._start = None
+        self._loads = SPRITES.loads()
+        self._installed = []
+
+    def install(self, game_: 'Game') -> None:
+        """Start timing the frames of <game_>."""
+        for index, name in enumerate(SPANS):
+            if name == 'player_move':
+                self._replace(actor.Character, name, self._timed(
+                    index, actor.Character.player_move))
+            elif name == '_draw':
+                self._replace(game_, name, self._frame(index, game_._draw))
+            else:
+                self._replace(game_, name,
+                              self._timed(index, getattr(game_, name)))
+        self._replace(game_, 'get_actor',
+                      self._counted(COUNTERS.index('get_actor'),
+                                    game_.get_actor))
+        self._replace(renderer, 'image_of',
+                      self._counted(COUNTERS.index('blits'),
+                                    renderer.image_of))
+
+    def uninstall(self) -> None:
+        """Put back everything replaced by install."""
+        for owner, name, original in reversed(self._installed):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self._installed = []
+
+    def end_frame(self) -> None:
+        """Record the frame in progress, if it has started."""
+        now = time.perf_counter()
+        if self._start is None:
+            return
+        slot = self._frames % self.capacity
+        self._frame_start[slot] = self._start
+        self._frame_length[slot] = now - self._start
+        loads = SPRITES.loads()
+        self._counts[COUNTERS.index('image_loads')] = loads - self._loads
+        self._loads = loads
+        base = slot * len(COUNTERS)
+        for index, count in enumerate(self._counts):
+            self._frame_counts[base + index] = count
+            self._counts[index] = 0
+        self._frames += 1
+        self._start = None
+
+    def spans(self) -> List[Tuple[str, float, float, int]]:
+        """Return the (name, start, length in seconds, frame number) of the
+        spans kept, oldest first.
+        """
+        return [(SPANS[self._span_name[slot]], self._span_start[slot],
+                 self._span_length[slot], self._span_frame[slot])
+                for slot in _slots(self._spans, self.capacity)]
+
+    def frames(self) -> List[Tuple[float, float, Dict[str, int]]]:
+        """Return the (start, length in seconds, counters) of the frames
+        kept, oldest first.
+        """
+        width = len(COUNTERS)
+        return [(self._frame_start[slot], self._frame_length[slot],
+                 dict(zip(COUNTERS, self._frame_counts[slot * width:
+                                                       (slot + 1) * width])))
+                for slot in _slots(self._frames, self.capacity)]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Return the PERCENTILES, maximum and number of calls of the length
+        in milliseconds of each span and of the frames, and the mean of each
+        counter per frame.
+        """
+        lengths = {}
+        for name, _, length, _ in self.spans():
+            lengths.setdefault(name, []).append(length * 1000)
+        frames = self.frames()
+        lengths['frame'] = [length * 1000 for _, length, _ in frames]
+        result = {name: _distribution(values)
+                  for name, values in lengths.items() if values}
+        if frames:
+            result['counters'] = {
+                name: sum(counts[name] for _, _, counts in frames)
+                / len(frames) for name in COUNTERS}
+        return result
+
+    def report(self) -> str:
+        """Return the summary as a table."""
+        lines = ["{:18} {:>8} {:>9} {:>9} {:>9} {:>9}".format(
+            "span (ms)", "calls",
+            *("p{}".format(p) for p in PERCENTILES), "max")]
+        summary = self.summary()
+        counters = summary.pop('counters', {})
+        for name, values in sorted(summary.items()):
+            lines.append("{:18} {:8d} {:9.3f} {:9.3f} {:9.3f} {:9.3f}".format(
+                name, int(values['calls']),
+                *(values['p{}'.format(p)] for p in PERCENTILES),
+                values['max']))
+        for name, mean in counters.items():
+            lines.append("{:18} {:8.1f} per frame".format(name, mean))
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Return the spans and frames kept in the Chrome trace-event
+        format, which chrome://tracing and Perfetto open.
+        """
+        events = []
+        for name, start, length, frame in self.spans():
+            events.append({'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                           'ts': start * 1e6, 'dur': length * 1e6,
+                           'args': {'frame': frame}})
+        for start, length, counts in self.frames():
+            events.append({'name': 'frame', 'ph': 'X', 'pid': 0, 'tid': 1,
+                           'ts': start * 1e6, 'dur': length * 1e6})
+            events.append({'name': 'counters', 'ph': 'C', 'pid': 0,
+                           'ts': start * 1e6, 'args': counts})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, path: str) -> None:
+        """Write the Chrome trace to the file at <path>."""
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+    def _replace(self, owner: Any, name: str, wrapper: Callable) -> None:
+        """Set the attribute <name> of <owner> to <wrapper>, remembering
+        what to put back. A method that <owner> only has through its class
+        is put back by deleting the wrapper.
+        """
+        self._installed.append((owner, name, vars(owner).get(name)))
+        setattr(owner, name, wrapper)
+
+    def _timed(self, index: int, func: Callable) -> Callable:
+        """Return <func> recording a span of SPANS[index] on every call."""
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            if self._start is None:
+                self._start = start
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._span(index, start, time.perf_counter() - start)
+        return timed
+
+    def _frame(self, index: int, func: Callable) -> Callable:
+        """Return <func> recording a span of SPANS[index], then ending the
+        frame, on every call.
+        """
+        timed = self._timed(index, func)
+
+        def frame(*args: Any, **kwargs: Any) -> Any:
+            try:
+                return timed(*args, **kwargs)
+            finally:
+                self.end_frame()
+        return frame
+
+    def _counted(self, index: int, func: Callable) -> Callable:
+        """Return <func> adding one to the counter COUNTERS[index] on every
+        call.
+        """
+        counts = self._counts
+
+        def counted(*args: Any, **kwargs: Any) -> Any:
+            counts[index] += 1
+            return func(*args, **kwargs)
+        return counted
+
+    def _span(self, index: int, start: float, length: float) -> None:
+        """Record a span of SPANS[index]."""
+        slot = self._spans % self.capacity
+        self._span_name[slot] = index
+        self._span_start[slot] = start
+        self._span_length[slot] = length
+        self._span_frame[slot] = self._frames
+        self._spans += 1
+
+
+def _slots(count: int, capacity: int) -> Iterable[int]:
+    """Return the slots of a ring of <capacity> holding the last of <count>
+    records, oldest first.
+    """
+    if count <= capacity:
+        return range(count)
+    first = count % capacity
+    return [*range(first, capacity), *range(first)]
+
+
+def _distribution(values: List[float]) -> Dict[str, float]:
+    """Return the PERCENTILES (nearest rank), maximum and number of
+    <values>.
+    """
+    values = sorted(values)
+    result = {'p{}'.format(p): values[min(len(values) - 1,
+                                          len(values) * p // 100)]
+              for p in PERCENTILES}
+    result['max'] = values[-1]
+    result['calls'] = len(values)
+    return result
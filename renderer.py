@@ -0,0 +1,183 @@
+import pygame
+from typing import Iterable, Optional, Tuple
+from settings import *
+from assets import SPRITES
+import actor
+
+
+class Renderer:
+    """Draws the part of the stage seen by a camera following the player,
+    touching only the cells that changed.
+
+    The screen shows a window of the stage, which scrolls when the player
+    comes within CAMERA_MARGIN tiles of its edge. The background and the
+    Bush tiles in view never change, so they are baked into a static layer
+    whenever the camera moves. A frame then restores the static layer under
+    each changed cell in view, blits the actors standing there and pushes
+    just those rectangles to the display. Frames with nothing to redraw
+    present nothing.
+
+    Only the cells in view are ever looked at, through the engine's cell
+    index, so a frame costs the same on a huge map as on a small one.
+
+    === Private Attributes ===
+    _screen:
+        The display surface
+    _background:
+        The background, centred on a surface the size of the screen
+    _static:
+        The background with every Bush in view already drawn on it
+    _full:
+        Whether the next frame has to redraw and present the whole screen
+    _camera:
+        The cell (x, y) shown in the top left corner of the screen
+    _view:
+        The number of cells (columns, rows) that fit on the screen
+    """
+    _screen: pygame.Surface
+    _background: Optional[pygame.Surface]
+    _static: Optional[pygame.Surface]
+    _full: bool
+    _camera: Tuple[int, int]
+    _view: Tuple[int, int]
+
+    def __init__(self, screen: pygame.Surface) -> None:
+        """Initialize a renderer drawing onto <screen>."""
+        self._screen = screen
+        self._background = None
+        self._static = None
+        self._full = True
+        self._camera = (0, 0)
+        width, height = screen.get_size()
+        self._view = (width // TILESIZE, height // TILESIZE)
+
+    def bake(self, background: pygame.Surface) -> None:
+        """Use <background>, centred on the screen, behind the stage."""
+        width, height = self._screen.get_size()
+        self._background = pygame.Surface((width, height)).convert()
+        self._background.blit(
+            background, ((0.5 * width) - (0.5 * background.get_width()),
+                         (0.5 * height) - (0.5 * background.get_height())))
+        self._full = True
+
+    def invalidate(self) -> None:
+        """Redraw the whole screen on the next frame."""
+        self._full = True
+
+    def needs_redraw(self) -> bool:
+        """Return whether the next frame redraws the whole screen."""
+        return self._full
+
+    def get_camera(self) -> Tuple[int, int]:
+        """Return the cell (x, y) shown in the top left corner."""
+        return self._camera
+
+    def draw(self, game_: 'Engine', cells: Iterable[Tuple[int, int]]) -> None:
+        """Move the camera to follow the player of <game_>, then redraw the
+        given <cells> that are in view and present them.
+
+        Does nothing if there are no cells to redraw, unless the camera
+        moved or the whole screen was invalidated.
+        """
+        if self._follow(game_):
+            self._full = True
+        if self._full:
+            self._draw_all(game_)
+            pygame.display.flip()
+            self._full = False
+            return
+
+        rects = []
+        for x, y in cells:
+            if self._in_view(x, y):
+                rects.append(self._draw_cell(game_, x, y))
+        if rects:
+            pygame.display.update(rects)
+
+    def _follow(self, game_: 'Engine') -> bool:
+        """Scroll the camera so that the player of <game_> is at least
+        CAMERA_MARGIN cells away from the edges of the screen, or as close to
+        that as the edges of the stage allow.
+
+        Return whether the camera moved.
+        """
+        player = game_.player
+        if player is None:
+            return False
+        left, top = self._camera
+        columns, rows = self._view
+        margin_x = min(CAMERA_MARGIN, (columns - 1) // 2)
+        margin_y = min(CAMERA_MARGIN, (rows - 1) // 2)
+        left = min(left, player.x - margin_x)
+        left = max(left, player.x - columns + 1 + margin_x)
+        top = min(top, player.y - margin_y)
+        top = max(top, player.y - rows + 1 + margin_y)
+        left = max(0, min(left, game_.x_tiles - columns))
+        top = max(0, min(top, game_.y_tiles - rows))
+        if (left, top) == self._camera:
+            return False
+        self._camera = (left, top)
+        return True
+
+    def _visible(self) -> Iterable[Tuple[int, int]]:
+        """Yield every cell (x, y) in view."""
+        left, top = self._camera
+        columns, rows = self._view
+        for y in range(top, top + rows):
+            for x in range(left, left + columns):
+                yield x, y
+
+    def _in_view(self, x: int, y: int) -> bool:
+        """Return whether the cell (x, y) is on the screen."""
+        left, top = self._camera
+        columns, rows = self._view
+        return left <= x < left + columns and top <= y < top + rows
+
+    def _draw_all(self, game_: 'Engine') -> None:
+        """Bake the static layer for the current camera, then draw every
+        actor in view on top of it.
+        """
+        self._static = self._background.copy()
+        player = game_.player
+        for x, y in self._visible():
+            for actor_ in game_.get_actors_at(x, y):
+                if isinstance(actor_, actor.Bush):
+                    self._static.blit(image_of(actor_), self._rect(x, y))
+        self._screen.blit(self._static, (0, 0))
+        for x, y in self._visible():
+            for actor_ in game_.get_actors_at(x, y):
+                if actor_ is not player and not isinstance(actor_, actor.Bush):
+                    self._screen.blit(image_of(actor_), self._rect(x, y))
+        # Blit the player at the end to make it above all other objects
+        if player and self._in_view(player.x, player.y):
+            self._screen.blit(image_of(player), self._rect(player.x, player.y))
+
+    def _draw_cell(self, game_: 'Engine', x: int, y: int) -> pygame.Rect:
+        """Redraw the cell (x, y) of <game_> and return its rectangle."""
+        rect = self._rect(x, y)
+        self._screen.blit(self._static, rect, rect)
+        player = game_.player
+        for actor_ in game_.get_actors_at(x, y):
+            if actor_ is not player and not isinstance(actor_, actor.Bush):
+                self._screen.blit(image_of(actor_), rect)
+        if player and player.x == x and player.y == y:
+            self._screen.blit(image_of(player), rect)
+        return rect
+
+    def _rect(self, x: int, y: int) -> pygame.Rect:
+        """Return the rectangle on the screen covered by the cell (x, y)."""
+        left, top = self._camera
+        return cell_rect(x - left, y - top)
+
+
+def cell_rect(x: int, y: int) -> pygame.Rect:
+    """Return the rectangle covered by the cell (x, y) when the stage is
+    drawn from its top left corner.
+    """
+    return pygame.Rect(x * TILESIZE, y * TILESIZE, TILESIZE, TILESIZE)
+
+
+def image_of(actor_: actor.Actor) -> pygame.Surface:
+    """Return the image of the sprite of <actor_>."""
+    path, flipped = actor_.sprite
+    return SPRITES.get(path, flipped=flipped)
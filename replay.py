@@ -0,0 +1,268 @@
+import struct
+import time
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
+from settings import *
+from engine import Engine
+
+MAGIC = b"MEEPREC3"
+# A keyframe of the whole state is written every this many moves
+KEYFRAME_INTERVAL = 200
+
+# Record opcodes: a step in DIRECTIONS[op & OP_DIRECTION], with OP_MOVED set
+# if the player actually moved, an undo, or a keyframe
+OP_DIRECTION = 0x03
+OP_MOVED = 0x10
+OP_UNDO = 0x20
+OP_KEYFRAME = 0xFF
+
+_HEADER = struct.Struct("<8sHI")         # magic, keyframe interval, map size
+_RECORD = struct.Struct("<BH")           # opcode, ms since the last record
+_KEYFRAME = struct.Struct("<IQI")        # move number, state hash, size
+
+
+class Recorder:
+    """Writes the moves and undos of a session to a replay log.
+
+    The log starts with the map, followed by one 3-byte record per step or
+    undo: the opcode and the milliseconds since the previous record, so that
+    the session can be played back at the speed it was played. Every
+    <interval> moves (and before the first one) a keyframe with the encoded
+    state of the game is written, which lets Replay.seek skip ahead.
+
+    === Public Attributes ===
+    moves:
+        The number of steps and undos recorded so far
+
+    === Private Attributes ===
+    _file:
+        The file the log is written to
+    _interval:
+        The number of moves between keyframes
+    _last:
+        The time of the previous record, from time.perf_counter
+    """
+    moves: int
+    _file: BinaryIO
+    _interval: int
+    _last: float
+
+    def __init__(self, file: BinaryIO, engine: Engine,
+                 interval: int = KEYFRAME_INTERVAL) -> None:
+        """Start recording the session of <engine>, which has just been
+        created by new, to <file>.
+        """
+        self.moves = 0
+        self._file = file
+        self._interval = interval
+        map_text = "\n".join(engine.map_data).encode("utf-8")
+        file.write(_HEADER.pack(MAGIC, interval, len(map_text)))
+        file.write(map_text)
+        self._keyframe(engine)
+        self._last = time.perf_counter()
+
+    def record_step(self, engine: Engine, direction: Tuple[int, int],
+                    moved: bool) -> None:
+        """Record a step of the player of <engine> in <direction>, and
+        whether the player moved.
+        """
+        op = DIRECTIONS.index(direction)
+        self._record(engine, op | OP_MOVED if moved else op)
+
+    def record_undo(self, engine: Engine) -> None:
+        """Record an undo in <engine>."""
+        self._record(engine, OP_UNDO)
+
+    def close(self) -> None:
+        """Flush and close the log."""
+        self._file.close()
+
+    def _record(self, engine: Engine, op: int) -> None:
+        """Write the record of <op>, then a keyframe if one is due."""
+        now = time.perf_counter()
+        delay = min(int((now - self._last) * 1000), 0xffff)
+        self._last = now
+        self._file.write(_RECORD.pack(op, delay))
+        self.moves += 1
+        # a finished game is not restorable, so it gets no keyframes
+        if self.moves % self._interval == 0 and engine.get_running():
+            self._keyframe(engine)
+
+    def _keyframe(self, engine: Engine) -> None:
+        """Write a keyframe of the current state of <engine>."""
+        snapshot = engine.snapshot()
+        self._file.write(bytes((OP_KEYFRAME,)))
+        self._file.write(_KEYFRAME.pack(self.moves, engine.state_hash(),
+                                        len(snapshot)))
+        self._file.write(snapshot)
+
+
+class Replay:
+    """A replay log read back into memory.
+
+    === Public Attributes ===
+    map_lines:
+        The lines of the map the session was played on
+    moves:
+        The (opcode, delay in ms) of every recorded step and undo
+    keyframes:
+        The (move number, state hash, snapshot) of every keyframe, in order
+
+    === Private Attributes ===
+    _depths:
+        The size of the undo history after each number of moves, starting
+        with 0 moves
+    _floors:
+        The smallest size of the undo history from each number of moves to
+        the end of the session
+    """
+    map_lines: List[str]
+    moves: List[Tuple[int, int]]
+    keyframes: List[Tuple[int, int, bytes]]
+    _depths: List[int]
+    _floors: List[int]
+
+    def __init__(self, data: bytes) -> None:
+        """Parse the replay log <data>.
+
+        Raise a ValueError if <data> is not a replay log.
+        """
+        if len(data) < _HEADER.size:
+            raise ValueError("not a replay log")
+        magic, _, size = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("not a replay log")
+        offset = _HEADER.size
+        self.map_lines = data[offset:offset + size].decode("utf-8").split("\n")
+        offset += size
+
+        self.moves = []
+        self.keyframes = []
+        while offset < len(data):
+            if data[offset] == OP_KEYFRAME:
+                number, hash_, size = _KEYFRAME.unpack_from(data, offset + 1)
+                offset += 1 + _KEYFRAME.size
+                self.keyframes.append((number, hash_,
+                                       data[offset:offset + size]))
+                offset += size
+            else:
+                self.moves.append(_RECORD.unpack_from(data, offset))
+                offset += _RECORD.size
+
+        # undos cannot reach past a keyframe, whose restore empties the
+        # history, so seek needs to know how deep the history is at each move
+        self._depths = [0]
+        for op, _ in self.moves:
+            depth = self._depths[-1]
+            if op == OP_UNDO:
+                depth = max(depth - 1, 0)
+            elif op & OP_MOVED:
+                depth += 1
+            self._depths.append(depth)
+        self._floors = self._depths[:]
+        for number in range(len(self._floors) - 2, -1, -1):
+            self._floors[number] = min(self._floors[number],
+                                       self._floors[number + 1])
+
+    @staticmethod
+    def load(path: str) -> 'Replay':
+        """Return the replay log stored in the file at <path>."""
+        with open(path, 'rb') as f:
+            return Replay(f.read())
+
+    def __len__(self) -> int:
+        """Return the number of recorded steps and undos."""
+        return len(self.moves)
+
+    def new_engine(self, cls: Callable[[], Engine] = Engine) -> Engine:
+        """Return a new engine of class <cls> at the start of the session."""
+        engine = cls()
+        engine.load_map_lines(self.map_lines)
+        engine.new()
+        return engine
+
+    def seek(self, engine: Engine, number: int) -> None:
+        """Put <engine> in the state after the first <number> moves.
+
+        The nearest keyframe at or before <number> is restored and only the
+        moves after it are replayed. A keyframe is skipped if any later undo
+        of the session would pop a move made before it, so that play can go
+        on from <number> to the end.
+        """
+        number = max(0, min(number, len(self.moves)))
+        start = self._keyframe_before(number)
+        if start is None:
+            # no usable keyframe: restart from a new engine state
+            fresh = self.new_engine()
+            engine.restore(fresh.snapshot())
+            first = 0
+        else:
+            first, _, snapshot = self.keyframes[start]
+            engine.restore(snapshot)
+        for op, _ in self.moves[first:number]:
+            apply(engine, op)
+
+    def play(self, engine: Engine, start: int = 0, realtime: bool = False,
+             verify: bool = True,
+             wait: Callable[[float], None] = time.sleep) -> Iterator[int]:
+        """Play the moves from <start> on in <engine>, which must be in the
+        state after <start> moves, yielding the number of moves played after
+        each one.
+
+        realtime: call <wait> with the recorded delay before each move
+        verify: check the state of <engine> at every keyframe and raise a
+            ValueError if it differs from the recorded one
+        """
+        expected = {number: hash_ for number, hash_, _ in self.keyframes}
+        for number in range(start, len(self.moves)):
+            op, delay = self.moves[number]
+            if realtime and delay:
+                wait(delay / 1000)
+            apply(engine, op)
+            if verify and number + 1 in expected \
+                    and engine.state_hash() != expected[number + 1]:
+                raise ValueError(
+                    "replay diverged at move {}".format(number + 1))
+            yield number + 1
+
+    def _keyframe_before(self, number: int) -> Optional[int]:
+        """Return the index of the latest keyframe at or before move
+        <number> that seek can start from, or None if there is none.
+        """
+        for index in range(len(self.keyframes) - 1, -1, -1):
+            first = self.keyframes[index][0]
+            if first <= number \
+                    and self._floors[first] >= self._depths[first]:
+                return index
+        return None
+
+
+def apply(engine: Engine, op: int) -> None:
+    """Play the recorded move <op> in <engine>."""
+    if op == OP_UNDO:
+        engine.undo()
+    else:
+        engine.step(DIRECTIONS[op & OP_DIRECTION])
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Play back a replay log without a window.")
+    parser.add_argument("log")
+    parser.add_argument("--seek", type=int, default=None,
+                        help="only restore the state after this many moves")
+    args = parser.parse_args()
+
+    replay = Replay.load(args.log)
+    engine = replay.new_engine()
+    begin = time.perf_counter()
+    if args.seek is not None:
+        replay.seek(engine, args.seek)
+        played = min(max(args.seek, 0), len(replay))
+    else:
+        played = 0
+        for played in replay.play(engine):
+            pass
+    print("{} of {} moves in {:.3f}s, {} keyframes, state {:016x}".format(
+        played, len(replay), time.perf_counter() - begin,
+        len(replay.keyframes), engine.state_hash()))
@@ -23,15 +23,75 @@ YELLOW = (255, 255, 0)
 FPS = 10
 TITLE = "Base Game"
 TILESIZE = 35
+# The most tiles (columns, rows) shown at once; larger maps scroll
+VIEW_TILES = (32, 20)
+# How close, in tiles, the player may get to the edge before it scrolls
+CAMERA_MARGIN = 4
+# Bytes of compressed undo history kept in memory before older moves are
+# spilled to a temporary file
+HISTORY_BUDGET = 4 * 1024 * 1024
+
+# Directions of movement as (dx, dy)
+LEFT = (-1, 0)
+RIGHT = (1, 0)
+UP = (0, -1)
+DOWN = (0, 1)
+DIRECTIONS = (LEFT, RIGHT, UP, DOWN)
+DIRECTION_NAMES = {LEFT: "L", RIGHT: "R", UP: "U", DOWN: "D"}
 
 SUBJECTS = {"W": "Wall", "R": "Rock", "F": "Flag", "M": "Meepo"}
 ATTRIBUTES = {"P": "Push", "S": "Stop", "V": "Victory", "L": "Lose", "Y": "You"}
 CHARACTERS = {"1": "Bush", "2": "Meepo", "3": "Wall", "4": "Rock", "5": "Flag"}
 
+# Every kind of actor: the characters, then the subject and attribute words
+# (in capitals) and the "IS" word. An actor's kind is its index in KINDS.
+KINDS = (list(CHARACTERS.values())
+         + [word.upper() for word in SUBJECTS.values()]
+         + [word.upper() for word in ATTRIBUTES.values()] + ["IS"])
+KIND_IDS = {kind: index for index, kind in enumerate(KINDS)}
+
+# Bits of an actor's flags
+BIT_PLAYER = 1
+BIT_PUSH = 2
+BIT_STOP = 4
+BIT_LOSE = 8
+BIT_WIN = 16
+
+# The flags each kind of actor starts with, by kind: bushes and rocks
+# cannot be moved through and word blocks can be pushed
+DEFAULT_FLAGS = tuple(BIT_STOP if kind in ("Bush", "Rock")
+                      else BIT_PUSH if kind.isupper() else 0
+                      for kind in KINDS)
+
+# The flags (set, cleared) on every subject of a rule when an attribute is
+# given (True) or taken away (False), as done by Engine.change_property
+PROPERTY_BITS = {
+    ('isPush', True): (BIT_PUSH, 0), ('isPush', False): (0, BIT_PUSH),
+    ('isStop', True): (BIT_STOP, 0), ('isStop', False): (0, BIT_STOP),
+    ('isVictory', True): (BIT_WIN, BIT_LOSE),
+    ('isVictory', False): (0, BIT_WIN),
+    ('isLose', True): (BIT_LOSE, BIT_WIN), ('isLose', False): (0, BIT_LOSE),
+    ('isYou', True): (BIT_PLAYER, 0), ('isYou', False): (0, BIT_PLAYER),
+}
+
+# Every rule that can be formed, e.g. "Meepo isPush", parsed once into the
+# kind of actor it applies to and its attribute
+RULE_TABLE = {subject + " is" + attribute: (KIND_IDS[subject],
+                                            "is" + attribute)
+              for subject in SUBJECTS.values()
+              for attribute in ATTRIBUTES.values()}
+
 BASE_DIR = "."
 SPRITES_DIR = "{}/sprites".format(BASE_DIR)
 MAP_PATH = "{}/maps/map.txt".format(BASE_DIR)
 
+BACKGROUND_SPRITE = "{}/backgroundBig.png".format(SPRITES_DIR)
+# Every tile sprite packed into one image, and where each one is in it
+ATLAS_PATH = "{}/atlas{}.png".format(SPRITES_DIR, TILESIZE)
+ATLAS_INDEX = "{}/atlas{}.json".format(SPRITES_DIR, TILESIZE)
+# Sprites already scaled and converted, kept between runs
+CACHE_DIR = "{}/cache".format(SPRITES_DIR)
+
 # Actors' sprites
 PLAYER_SPRITE_R1 = "{}/playerR1.png".format(SPRITES_DIR)
 PLAYER_SPRITE_R2 = "{}/playerR2.png".format(SPRITES_DIR)
@@ -49,9 +109,8 @@ IS_PURPLE = "{}/isPurple.png".format(SPRITES_DIR)
 IS_DARK_BLUE = "{}/isDarkBlue.png".format(SPRITES_DIR)
 IS_LIGHT_BLUE = "{}/isLightBlue.png".format(SPRITES_DIR)
 
-WORDS_SPRITES = {}
-for word in (list(SUBJECTS.values()) + list(ATTRIBUTES.values())):
-    filepath = "{}/{}.png".format(SPRITES_DIR, word.lower())
-    if os.path.exists(filepath):
-        WORDS_SPRITES[word.lower()] = filepath
+# Sprites are only read when first drawn, so nothing here touches the disk
+WORDS_SPRITES = {word.lower(): "{}/{}.png".format(SPRITES_DIR, word.lower())
+                 for word in (list(SUBJECTS.values())
+                              + list(ATTRIBUTES.values()))}
 
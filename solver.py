@@ -0,0 +1,213 @@
+import heapq
+import sys
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+from settings import *
+from engine import Engine
+import actor
+
+# Default search budgets
+MAX_NODES = 1000000
+MAX_MEMORY = 512 * 1024 * 1024  # bytes
+MAX_SECONDS = None  # no time limit
+# Approximate bytes per stored state besides its encoding: the hash, the
+# parent link and their share of the dict and frontier
+STATE_OVERHEAD = 200
+
+
+class SearchResult:
+    """
+    The outcome of a search for the shortest way to win a map.
+
+    === Public Attributes ===
+    solved:
+        Whether a winning sequence of moves was found
+    moves:
+        The winning directions (dx, dy) in order, or None if not solved
+    nodes:
+        The number of states expanded
+    states:
+        The number of distinct states seen
+    seconds:
+        Wall time spent searching
+    reason:
+        Why the search stopped: "solved", "exhausted", "node budget",
+        "memory budget" or "time budget"
+    """
+    solved: bool
+    moves: Optional[List[Tuple[int, int]]]
+    nodes: int
+    states: int
+    seconds: float
+    reason: str
+
+    def __init__(self, moves: Optional[List[Tuple[int, int]]], nodes: int,
+                 states: int, seconds: float, reason: str) -> None:
+        """
+        Initialize the result of a search.
+        """
+        self.solved = moves is not None
+        self.moves = moves
+        self.nodes = nodes
+        self.states = states
+        self.seconds = seconds
+        self.reason = reason
+
+    def nodes_per_second(self) -> float:
+        """
+        Return the number of states expanded per second of search.
+        """
+        return self.nodes / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        """
+        Return a one-line summary of this result.
+        """
+        if self.solved:
+            outcome = "solved in {} moves: {}".format(
+                len(self.moves),
+                ''.join(DIRECTION_NAMES[move] for move in self.moves))
+        else:
+            outcome = "not solved ({})".format(self.reason)
+        return "{}; {} nodes, {} states, {:.2f}s, {:.0f} nodes/s".format(
+            outcome, self.nodes, self.states, self.seconds,
+            self.nodes_per_second())
+
+
+def solve(path: str, method: str = "bfs", max_nodes: int = MAX_NODES,
+          max_memory: int = MAX_MEMORY,
+          max_seconds: Optional[float] = MAX_SECONDS) -> SearchResult:
+    """
+    Search for the shortest sequence of moves that wins the map at <path>.
+
+    The search runs on a headless Engine, so pushing word blocks changes the
+    rules (and with them which actor is the player or the victory) exactly
+    as in the game. States are deduplicated by their Zobrist hash, and states
+    in which the player lost are dropped.
+
+    method: "bfs" finds a shortest solution; "astar" orders the search by
+        the distance from the player to the nearest victory, which is usually
+        much faster but may miss the shortest solution when rules change.
+    max_nodes: the maximum number of states to expand
+    max_memory: the approximate maximum number of bytes of stored states
+    max_seconds: the maximum wall time of the search, or None for no limit
+    """
+    engine = Engine()
+    engine.load_map(path)
+    engine.new()
+    return search(engine, method, max_nodes, max_memory, max_seconds)
+
+
+def search(engine: Engine, method: str = "bfs", max_nodes: int = MAX_NODES,
+           max_memory: int = MAX_MEMORY,
+           max_seconds: Optional[float] = MAX_SECONDS) -> SearchResult:
+    """
+    Search for the shortest sequence of moves that wins the game from the
+    current state of <engine>. See solve.
+    """
+    if method not in ("bfs", "astar"):
+        raise ValueError("unknown search method: {}".format(method))
+    start = time.perf_counter()
+    root = engine.snapshot()
+    # a stored state costs its encoding, plus its key and parent link
+    state_size = sys.getsizeof(root) + STATE_OVERHEAD
+    parents = {engine.state_hash(): None}
+    counter = 0
+    if method == "bfs":
+        frontier = deque([(engine.state_hash(), root)])
+    else:
+        frontier = [(distance_to_victory(engine), counter, 0,
+                     engine.state_hash(), root)]
+
+    nodes = 0
+    reason = "exhausted"
+    while frontier:
+        if nodes >= max_nodes:
+            reason = "node budget"
+            break
+        if len(parents) * state_size > max_memory:
+            reason = "memory budget"
+            break
+        if max_seconds is not None \
+                and time.perf_counter() - start > max_seconds:
+            reason = "time budget"
+            break
+        if method == "bfs":
+            key, state = frontier.popleft()
+            depth = 0
+        else:
+            _, _, depth, key, state = heapq.heappop(frontier)
+        nodes += 1
+
+        for direction in DIRECTIONS:
+            engine.restore(state)
+            if not engine.step(direction):
+                continue
+            if engine.has_won():
+                moves = _path(parents, key) + [direction]
+                engine.restore(root)
+                return SearchResult(moves, nodes, len(parents),
+                                    time.perf_counter() - start, "solved")
+            if engine.player is None:
+                continue
+            child = engine.state_hash()
+            if child in parents:
+                continue
+            parents[child] = (key, direction)
+            if method == "bfs":
+                frontier.append((child, engine.snapshot()))
+            else:
+                counter += 1
+                heapq.heappush(frontier, (depth + 1 + distance_to_victory(
+                    engine), counter, depth + 1, child, engine.snapshot()))
+
+    engine.restore(root)
+    return SearchResult(None, nodes, len(parents),
+                        time.perf_counter() - start, reason)
+
+
+def distance_to_victory(engine: Engine) -> int:
+    """
+    Return the Manhattan distance from the nearest player of <engine> to the
+    nearest victory, or 1 if there is no victory on the stage yet.
+    """
+    players = engine.players()
+    best = None
+    for actor_ in engine.get_actors():
+        if isinstance(actor_, actor.Character) and actor_.is_win():
+            for player in players:
+                distance = abs(actor_.x - player.x) + abs(actor_.y - player.y)
+                if best is None or distance < best:
+                    best = distance
+    return 1 if best is None else best
+
+
+def _path(parents: Dict[int, Any], key: int) -> List[Tuple[int, int]]:
+    """
+    Return the moves that lead from the root of the search to the state
+    with the hash <key>.
+    """
+    moves = []
+    while parents[key] is not None:
+        key, direction = parents[key]
+        moves.append(direction)
+    moves.reverse()
+    return moves
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Find the shortest way to win a map.")
+    parser.add_argument("map", nargs="?", default=MAP_PATH)
+    parser.add_argument("--method", choices=("bfs", "astar"), default="bfs")
+    parser.add_argument("--max-nodes", type=int, default=MAX_NODES)
+    parser.add_argument("--max-memory", type=int,
+                        default=MAX_MEMORY // (1024 * 1024),
+                        help="memory budget in MB")
+    parser.add_argument("--max-seconds", type=float, default=MAX_SECONDS,
+                        help="time budget in seconds")
+    args = parser.parse_args()
+    print(solve(args.map, args.method, args.max_nodes,
+                args.max_memory * 1024 * 1024, args.max_seconds))
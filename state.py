@@ -0,0 +1,117 @@
+from array import array
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+from settings import *
+
+MASK = (1 << 64) - 1
+
+# Every rule that can be formed, e.g. "Meepo isYou", and its id
+RULES = [subject + " is" + attribute
+         for subject in SUBJECTS.values() for attribute in ATTRIBUTES.values()]
+RULE_IDS = {rule: index for index, rule in enumerate(RULES)}
+
+
+class Zobrist:
+    """Deterministic 64-bit Zobrist keys for the parts of a game state.
+
+    The hash of a state is the XOR of the keys of its parts: each piece
+    (kind and cell), the flags of each kind, the cell and kind of the player,
+    and each active rule. Moving a piece or changing the flags of a kind is
+    then an O(1) update: XOR out the old key and XOR in the new one.
+
+    Keys are derived from the seed with the SplitMix64 mixer, so the same
+    part gets the same key in every process, and they are cached on first
+    use rather than tabulated for the largest possible map.
+
+    === Private Attributes ===
+    _seed:
+        The seed the keys are derived from
+    _keys:
+        Keys computed so far, by the index of the part they belong to
+    """
+    _seed: int
+    _keys: Dict[int, int]
+
+    def __init__(self, seed: int = 0) -> None:
+        """Initialize the keys derived from <seed>."""
+        self._seed = seed
+        self._keys = {}
+
+    def piece(self, kind: int, x: int, y: int) -> int:
+        """Return the key of a piece of <kind> in the cell (x, y)."""
+        return self._key(piece_index(kind, x, y))
+
+    def flags(self, kind: int, bits: int) -> int:
+        """Return the key of the actors of <kind> having the flags <bits>.
+        """
+        return self._key((kind << 8 | bits) << 2 | 3)
+
+    def player(self, kind: int, x: int, y: int) -> int:
+        """Return the key of the player being of <kind> in the cell (x, y).
+        """
+        return self._key((((kind << 16) | (x & 0xffff)) << 16
+                          | (y & 0xffff)) << 2 | 1)
+
+    def rule(self, rule: str) -> int:
+        """Return the key of <rule> being active."""
+        return self._key(RULE_IDS[rule] << 2 | 2)
+
+    def _key(self, index: int) -> int:
+        """Return the key of the part with the given <index>."""
+        key = self._keys.get(index)
+        if key is None:
+            key = self._keys[index] = mix(index, self._seed)
+        return key
+
+
+def piece_index(kind: int, x: int, y: int) -> int:
+    """Return the index of the key of a piece of <kind> in the cell (x, y).
+    """
+    return ((kind << 16 | (x & 0xffff)) << 16 | (y & 0xffff)) << 2
+
+
+def mix(index: int, seed: int) -> int:
+    """Return the SplitMix64 mix of <index> and <seed>."""
+    z = (index * 0x9E3779B97F4A7C15 + seed) & MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK
+    return z ^ (z >> 31)
+
+
+# The keys shared by every engine in the process
+ZOBRIST = Zobrist()
+
+
+def encode(pieces: Iterable['Actor'], off_stage: Set['Actor'], player: int,
+           rules: Iterable[str], flags: Sequence[int]) -> bytes:
+    """Return a compact encoding of a game state.
+
+    The state is the index of the player among <pieces> (or -1) as a 32-bit
+    integer, since a large map has more pieces than a 16-bit one can count,
+    then an array of 16-bit integers: the number of active <rules> and their
+    sorted ids, the <flags> of every kind, then (x, y, 1 if off the stage
+    else 0) for every piece.
+    """
+    rule_ids = sorted(RULE_IDS[rule] for rule in rules)
+    values = array('h', [len(rule_ids)])
+    values.extend(rule_ids)
+    values.extend(flags)
+    for piece in pieces:
+        values.extend((piece.x, piece.y, piece in off_stage))
+    return array('i', [player]).tobytes() + values.tobytes()
+
+
+def decode(data: bytes) -> Tuple[int, List[str], List[int],
+                                 List[Tuple[int, int, int]]]:
+    """Return the player index, the active rules, the flags of every kind and
+    the (x, y, off stage) of every piece of a state encoded by encode.
+    """
+    header = array('i')
+    header.frombytes(data[:header.itemsize])
+    values = array('h')
+    values.frombytes(data[header.itemsize:])
+    player, count = header[0], values[0]
+    rules = [RULES[rule_id] for rule_id in values[1:1 + count]]
+    start = 1 + count + len(KINDS)
+    flags = values[1 + count:start].tolist()
+    pieces = [tuple(values[i:i + 3]) for i in range(start, len(values), 3)]
+    return player, rules, flags, pieces
@@ -0,0 +1,219 @@
+from settings import *
+from engine import Engine
+import pytest
+import state
+
+# A map with no border of bushes: Meepo stands on the right edge
+UNBORDERED = ["MIY.", "...2"]
+
+
+def load(lines):
+    engine = Engine()
+    engine.load_map_lines(lines)
+    engine.new()
+    return engine
+
+
+def test_edge_of_unbordered_map_stops_the_player():
+    pytest.importorskip("numpy")
+    engine = load(UNBORDERED)
+    engine.observation()
+    assert not engine.step(RIGHT)
+    assert not engine.step(DOWN)
+    assert (engine.player.x, engine.player.y) == (3, 1)
+    player = state.ZOBRIST.player(engine.player.kind, 3, 1)
+    assert engine.state_hash() == engine._compute_hash() ^ player
+
+
+def test_observation_follows_moves_on_unbordered_map():
+    pytest.importorskip("numpy")
+    engine = load(UNBORDERED)
+    observation = engine.observation()
+    meepo = KINDS.index("Meepo")
+    assert engine.step(LEFT)
+    assert observation[meepo, 1, 2] == 1
+    assert observation[meepo].sum() == 1
+    assert not observation.flags.writeable
+
+
+def test_batch_on_unbordered_map():
+    pytest.importorskip("numpy")
+    from batch import BatchEnv
+    env = BatchEnv.copies(UNBORDERED, 3)
+    observations, rewards, dones = env.step(
+        [DIRECTIONS.index(RIGHT), DIRECTIONS.index(DOWN),
+         DIRECTIONS.index(LEFT)])
+    assert not dones.any()
+    assert observations[:, KINDS.index("Meepo")].sum() == 3
+
+
+def test_snapshot_of_map_with_more_pieces_than_a_short_counts():
+    # "Rock is You" makes the last of 33800 rocks the player
+    engine = load(["RIY".ljust(200, '.')] + ['4' * 200] * 169)
+    assert engine.player is engine._pieces[-1]
+    snapshot = engine.snapshot()
+    engine.restore(snapshot)
+    assert engine.player is engine._pieces[-1]
+    assert engine.snapshot() == snapshot
+
+
+def test_every_kind_that_is_you_moves():
+    engine = load(["1111111111",
+                   "1MIY.RIY.1",
+                   "1........1",
+                   "1.2...4..1",
+                   "1........1",
+                   "1111111111"])
+    assert engine.step(UP)
+    assert sorted((type(player).__name__, player.x, player.y)
+                  for player in engine.players()) == [("Meepo", 2, 2),
+                                                      ("Rock", 6, 2)]
+    engine.undo()
+    assert [(player.x, player.y) for player in engine.players()] == \
+        [(2, 3), (6, 3)]
+
+
+def test_generated_map_has_room_for_its_header_rules():
+    import mapgen
+    assert mapgen.generate(13, 9, chains=1)[1] == "1MIY.FIV.RIP1"
+    with pytest.raises(ValueError, match="at least 13 x 4"):
+        mapgen.generate(12, 9, chains=1)
+
+
+def test_seek_then_play_matches_the_session():
+    import io
+    from replay import Recorder, Replay
+    lines = ["1111111111111", "1MIY.FIV....1", "1.2.........1",
+             "1111111111111"]
+    engine = load(lines)
+    log = io.BytesIO()
+    recorder = Recorder(log, engine, interval=4)
+    for _ in range(6):
+        recorder.record_step(engine, RIGHT, engine.step(RIGHT))
+    for _ in range(4):
+        engine.undo()
+        recorder.record_undo(engine)
+    assert engine.player.x == 4
+    replay = Replay(log.getvalue())
+    for start in range(len(replay) + 1):
+        copy = replay.new_engine()
+        replay.seek(copy, start)
+        for _ in replay.play(copy, start):
+            pass
+        assert copy.player.x == 4
+        assert copy.state_hash() == engine.state_hash()
+
+
+def test_push_moves_the_first_actor_of_a_cell():
+    # Meepo pushes the rock onto the wall, then on again: the rock comes
+    # before the wall in the list of actors, so it is the bottom actor of
+    # their cell even though the wall was there first
+    engine = load(["111111111",
+                   "1RIP.MIY1",
+                   "12.43...1",
+                   "111111111"])
+    for _ in range(4):
+        engine.step(RIGHT)
+    assert [(type(actor_).__name__, actor_.x, actor_.y)
+            for actor_ in engine.get_actors()
+            if type(actor_).__name__ in ("Meepo", "Rock")] == \
+        [("Meepo", 4, 2), ("Rock", 5, 2)]
+
+
+# Meepo two cells below the "IS" of "Rock is Push", four cells left of a flag
+ROOM = ["1111111111",
+        "1MIY.FIV.1",
+        "1........1",
+        "1.RIP....1",
+        "1........1",
+        "1..2...5.1",
+        "1111111111"]
+
+
+def test_undo_through_compressed_and_spilled_history():
+    engine = load(ROOM)
+    engine._history.budget = 64
+    hashes = [engine.state_hash()]
+    for move in range(1500):
+        assert engine.step(LEFT if move % 4 < 2 else RIGHT)
+        hashes.append(engine.state_hash())
+    assert engine._history.memory()['spilled'] > 0
+    while len(hashes) > 1:
+        hashes.pop()
+        engine.undo()
+        assert engine.state_hash() == hashes[-1]
+    assert (engine.player.x, engine.player.y) == (3, 5)
+    assert engine._history.is_empty()
+
+
+def test_snapshot_restores_positions_and_rules():
+    engine = load(ROOM)
+    start = engine.snapshot()
+    rules = sorted(engine.get_rules())
+    # push the "IS" out of "Rock is Push"
+    assert engine.step(UP) and engine.step(UP)
+    assert "Rock isPush" not in engine.get_rules()
+    moved = engine.snapshot()
+    engine.restore(start)
+    assert sorted(engine.get_rules()) == rules
+    assert (engine.player.x, engine.player.y) == (3, 5)
+    assert engine.snapshot() == start
+    assert engine._hash == engine._compute_hash()
+    engine.restore(moved)
+    assert "Rock isPush" not in engine.get_rules()
+    assert (engine.player.x, engine.player.y) == (3, 3)
+    assert engine.snapshot() == moved
+    assert engine._hash == engine._compute_hash()
+
+
+@pytest.mark.parametrize("method", ["bfs", "astar"])
+def test_solver_finds_the_shortest_way_to_the_flag(method):
+    import solver
+    engine = load(ROOM)
+    start = engine.snapshot()
+    result = solver.search(engine, method)
+    assert result.solved and result.reason == "solved"
+    assert len(result.moves) == 4
+    assert engine.snapshot() == start
+    for direction in result.moves:
+        engine.step(direction)
+    assert engine.has_won()
+
+
+def test_bench_times_a_push_and_flags_regressions():
+    import bench
+    results = bench.bench_push(4, 1)
+    assert sorted(results) == ["push/4", "undo/4"]
+    assert all(seconds > 0 for seconds in results.values())
+    slower = {name: seconds * 2 for name, seconds in results.items()}
+    assert bench.compare(slower, results) == ["push/4", "undo/4"]
+    assert bench.compare(results, slower) == []
+
+
+def test_atlas_serves_the_pixels_of_each_sprite(tmp_path, monkeypatch):
+    pygame = pytest.importorskip("pygame")
+    monkeypatch.setenv("SDL_VIDEODRIVER", "dummy")
+    import assets
+    pygame.display.init()
+    try:
+        pygame.display.set_mode((1, 1))
+        atlas, index = assets.build_atlas()
+        path, index_path = str(tmp_path / "atlas.png"), \
+            str(tmp_path / "atlas.json")
+        assets.save_atlas(atlas, index, path, index_path)
+        assert sorted(file.name for file in tmp_path.iterdir()) == \
+            ["atlas.json", "atlas.png"]
+        assert not assets._atlas_is_stale(path, index_path)
+        cache = assets.SpriteCache()
+        cache.use_atlas(path, index_path)
+        for name in assets.tile_sprites():
+            sprite = cache.get("{}/{}".format(SPRITES_DIR, name))
+            assert sprite.get_parent() is not None
+            image = pygame.image.load("{}/{}".format(SPRITES_DIR, name))
+            image = pygame.transform.scale(image.convert_alpha(),
+                                           (TILESIZE, TILESIZE))
+            for point in [(0, 0), (TILESIZE // 2, TILESIZE // 2),
+                          (TILESIZE - 1, TILESIZE - 1)]:
+                assert sprite.get_at(point) == image.get_at(point)
+    finally:
+        pygame.display.quit()
@@ -0,0 +1,249 @@
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from settings import *
+from engine import Engine
+import solver
+
+try:
+    import resource
+except ImportError:     # not on Windows; the memory limit is then estimated
+    resource = None
+
+# Default limits for each map
+TIME_LIMIT = 60.0  # seconds
+MEMORY_LIMIT = 512  # MB
+# Extension of the map files looked for in a directory
+MAP_EXTENSION = ".txt"
+
+
+class MapReport:
+    """
+    The outcome of validating one map.
+
+    === Public Attributes ===
+    path:
+        The path of the map
+    status:
+        "solvable", "unsolvable" (every reachable state was searched),
+        "unknown" (a limit was hit first), "invalid" (the solution found does
+        not win when played back) or "error" (the map could not be played)
+    length:
+        The number of moves of the solution, or None if there is none
+    nodes:
+        The number of states expanded
+    seconds:
+        Wall time spent searching
+    detail:
+        Why the search stopped, or the error raised by the map
+    """
+    path: str
+    status: str
+    length: Optional[int]
+    nodes: int
+    seconds: float
+    detail: str
+
+    def __init__(self, path: str, status: str, length: Optional[int] = None,
+                 nodes: int = 0, seconds: float = 0.0,
+                 detail: str = "") -> None:
+        """
+        Initialize the report of the map at <path>.
+        """
+        self.path = path
+        self.status = status
+        self.length = length
+        self.nodes = nodes
+        self.seconds = seconds
+        self.detail = detail
+
+    def to_dict(self) -> Dict[str, object]:
+        """
+        Return this report as a dictionary that can be saved as JSON.
+        """
+        return {"path": self.path, "status": self.status,
+                "length": self.length, "nodes": self.nodes,
+                "seconds": self.seconds, "detail": self.detail}
+
+    def __str__(self) -> str:
+        """
+        Return a one-line summary of this report.
+        """
+        length = "-" if self.length is None else str(self.length)
+        return "{:10} {:>6} moves {:>9} nodes {:8.2f}s  {}  {}".format(
+            self.status, length, self.nodes, self.seconds, self.path,
+            self.detail)
+
+
+def validate_map(path: str, method: str = "bfs",
+                 max_nodes: int = solver.MAX_NODES,
+                 time_limit: Optional[float] = TIME_LIMIT,
+                 memory_limit: int = MEMORY_LIMIT) -> MapReport:
+    """
+    Search for a solution of the map at <path> within <time_limit> seconds
+    and <memory_limit> MB of stored states, then check that the solution
+    wins when played back on a fresh engine.
+
+    The solver stops by itself once its estimate of the memory of the
+    stored states reaches <memory_limit>; the hard limit on the whole
+    process is set by the worker that calls this (see _validate).
+    """
+    try:
+        result = solver.solve(path, method, max_nodes,
+                              memory_limit * 1024 * 1024, time_limit)
+    except MemoryError:
+        return MapReport(path, "unknown", detail="out of memory")
+    except Exception as error:
+        return MapReport(path, "error",
+                         detail="{}: {}".format(type(error).__name__, error))
+
+    if not result.solved:
+        status = "unsolvable" if result.reason == "exhausted" else "unknown"
+        return MapReport(path, status, None, result.nodes, result.seconds,
+                         result.reason)
+    status = "solvable" if wins(path, result.moves) else "invalid"
+    return MapReport(path, status, len(result.moves), result.nodes,
+                     result.seconds, ''.join(DIRECTION_NAMES[move]
+                                             for move in result.moves))
+
+
+def wins(path: str, moves: Iterable[Tuple[int, int]]) -> bool:
+    """
+    Return whether playing <moves> from the start of the map at <path> wins
+    it.
+    """
+    engine = Engine()
+    engine.load_map(path)
+    engine.new()
+    for move in moves:
+        engine.step(move)
+    return engine.has_won()
+
+
+def find_maps(paths: Iterable[str]) -> List[str]:
+    """
+    Return the map files among <paths>, looking into directories for files
+    ending in MAP_EXTENSION. The largest maps come first, so that they start
+    early and do not hold up the end of a parallel run.
+    """
+    maps = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(MAP_EXTENSION):
+                    maps.append(os.path.join(path, name))
+        else:
+            maps.append(path)
+    maps.sort(key=_size, reverse=True)
+    return maps
+
+
+def _size(path: str) -> int:
+    """
+    Return the size of the file at <path>, or 0 if there is none; a missing
+    map is reported as an error when it is validated.
+    """
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _validate(task: Tuple[str, str, int, Optional[float], int]) -> MapReport:
+    """
+    Validate one map in a worker process; <task> holds the arguments of
+    validate_map. The process is first limited to its current size plus the
+    memory limit of the map.
+    """
+    memory_limit = task[4]
+    if resource is not None:
+        limit = _address_space() + memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS,
+                           (limit, resource.getrlimit(resource.RLIMIT_AS)[1]))
+    return validate_map(*task)
+
+
+def _address_space() -> int:
+    """
+    Return the size in bytes of the address space of this process, or 0 if
+    it is not known.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return 0
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def validate_all(maps: List[str], jobs: Optional[int] = None,
+                 method: str = "bfs", max_nodes: int = solver.MAX_NODES,
+                 time_limit: Optional[float] = TIME_LIMIT,
+                 memory_limit: int = MEMORY_LIMIT) -> Iterable[MapReport]:
+    """
+    Validate <maps> on a pool of <jobs> processes (one per core if None),
+    yielding each report as soon as its map is done.
+
+    Every map gets a fresh worker process, so the memory of one search is
+    given back before the next one starts, and each worker can hold only
+    <memory_limit> MB more than it started with: a search that goes over
+    gets a MemoryError and the map is reported "unknown".
+    """
+    tasks = [(path, method, max_nodes, time_limit, memory_limit)
+             for path in maps]
+    with multiprocessing.Pool(jobs, maxtasksperchild=1) as pool:
+        for report in pool.imap_unordered(_validate, tasks):
+            yield report
+
+
+def summary(reports: List[MapReport], wall: float) -> str:
+    """
+    Return the count of maps by status, and how the total search time
+    compares with the <wall> time of the whole run.
+    """
+    counts = {}
+    for report in reports:
+        counts[report.status] = counts.get(report.status, 0) + 1
+    searched = sum(report.seconds for report in reports)
+    return "{} maps: {}; {:.2f}s of search in {:.2f}s ({:.1f}x)".format(
+        len(reports), ", ".join("{} {}".format(count, status)
+                                for status, count in sorted(counts.items())),
+        searched, wall, searched / wall if wall > 0 else 0.0)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Check that every map of a level pack can be won.")
+    parser.add_argument("paths", nargs="+", metavar="PATH",
+                        help="map files, or directories of them")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="number of worker processes (default: one per "
+                             "core)")
+    parser.add_argument("--method", choices=("bfs", "astar"), default="bfs")
+    parser.add_argument("--max-nodes", type=int, default=solver.MAX_NODES)
+    parser.add_argument("--time-limit", type=float, default=TIME_LIMIT,
+                        help="seconds of search per map")
+    parser.add_argument("--memory-limit", type=int, default=MEMORY_LIMIT,
+                        help="MB of stored states per map")
+    parser.add_argument("--output", metavar="FILE",
+                        help="write the reports to FILE as JSON")
+    args = parser.parse_args()
+
+    begin = time.perf_counter()
+    reports = []
+    for report in validate_all(find_maps(args.paths), args.jobs, args.method,
+                               args.max_nodes, args.time_limit,
+                               args.memory_limit):
+        print(report, flush=True)
+        reports.append(report)
+    reports.sort(key=lambda report: report.path)
+    print(summary(reports, time.perf_counter() - begin))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump([report.to_dict() for report in reports], f, indent=2)
+    if any(report.status != "solvable" for report in reports):
+        sys.exit(1)